@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""TIS paket çözücü benchmark - TISPacket.parse (dict) vs TISFrame.parse (__slots__).
+
+Kullanım:
+    python3 benchmark_parser.py [frame_sayısı]
+
+İki erişim deseni ölçülür: bus dağıtımı (her frame için sadece OpCode ve kaynak
+adresi okunur) ve payload tüketimi (başlık + additional_data). Ayrıca CRC
+doğrulamanın maliyeti (tablo döngüsü vs crc_hqx) ölçülür.
+"""
+import sys
+import time
+
+from tis_protocol import (SMARTCLOUD_MARKER, TISFrame, TISPacket, calculate_crc_table,
+                          smartcloud_offset, verify_crc_batch)
+
+ENVELOPE = bytes([192, 168, 1, 10]) + b'SMARTCLOUD'
+
+
+def strip_smartcloud(data: bytes) -> bytes:
+    """[IP (4)] + SMARTCLOUD (10) zarfını at (eski kopyalayan yol, karşılaştırma için)"""
+    idx = data.find(SMARTCLOUD_MARKER)
+    if idx != -1:
+        return data[idx + len(SMARTCLOUD_MARKER):]
+    return data
+
+
+def build_sample_frames():
+    """Yoğun bir bus'taki tipik trafik karışımı"""
+    samples = []
+    for op_code, payload in (
+        (0x0032, bytes([5, 0xF8, 124, 0, 0])),          # Kanal geri bildirimi
+        (0x0034, bytes([24]) + bytes(range(24))),        # Çok kanallı durum
+        (0xF00F, bytes([3]) + 'KORİDOR'.encode()),       # Kanal adı
+        (0x2011, bytes(range(16))),                      # Sensör verisi
+        (0xF004, b''),                                   # Discovery yanıtı
+    ):
+        packet = TISPacket()
+        packet.src_subnet = 1
+        packet.src_device = 10
+        packet.src_type = 0x01A8
+        packet.op_code = op_code
+        packet.additional_data = payload
+        samples.append(ENVELOPE + packet.build())
+    return samples
+
+
+def bench_dict_dispatch(frames):
+    """Bus dağıtımı: her frame için OpCode + kaynak adresi"""
+    checksum = 0
+    for data in frames:
+        parsed = TISPacket.parse(strip_smartcloud(data))
+        checksum += parsed['op_code'] + parsed['src_subnet'] + parsed['src_device']
+    return checksum
+
+
+def bench_frame_dispatch(frames):
+    checksum = 0
+    for data in frames:
+        parsed = TISFrame.parse(data, smartcloud_offset(data))
+        checksum += parsed.op_code + parsed.src_subnet + parsed.src_device
+    return checksum
+
+
+def bench_dict_payload(frames):
+    """Tüketici: başlık + payload'ın tamamı"""
+    checksum = 0
+    for data in frames:
+        parsed = TISPacket.parse(strip_smartcloud(data))
+        additional = parsed['additional_data']
+        checksum += parsed['op_code'] + len(additional)
+        if additional:
+            checksum += additional[-1]
+    return checksum
+
+
+def bench_frame_payload(frames):
+    checksum = 0
+    for data in frames:
+        parsed = TISFrame.parse(data, smartcloud_offset(data))
+        payload = parsed.payload
+        checksum += parsed.op_code + len(payload)
+        if len(payload):
+            checksum += payload[-1]
+    return checksum
+
+
+def bench_crc_table(frames):
+    """Doğrulama: Pack_crc tablo döngüsü (saf Python)"""
+    valid = 0
+    for data in frames:
+        tis = strip_smartcloud(data)
+        end = tis[2]
+        valid += calculate_crc_table(tis[2:end]) == ((tis[end] << 8) | tis[end + 1])
+    return valid
+
+
+def bench_crc_verified_parse(frames):
+    """Doğrulama: TISFrame.parse(verify=True)"""
+    valid = 0
+    for data in frames:
+        valid += TISFrame.parse(data, smartcloud_offset(data), verify=True) is not None
+    return valid
+
+
+def bench_crc_batch(frames):
+    """Doğrulama: verify_crc_batch (yakalanmış paketler)"""
+    return sum(verify_crc_batch(frames))
+
+
+def run(name, func, frames, rounds=5):
+    best = None
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(frames)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    rate = len(frames) / best
+    print(f"{name:<28} {rate:>12,.0f} frames/s  ({best * 1000:.1f} ms / {len(frames)} frames)")
+    return rate, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    samples = build_sample_frames()
+    frames = [samples[i % len(samples)] for i in range(count)]
+
+    print(f"=== TIS parser benchmark: {count} frames ===")
+    for label, dict_func, frame_func in (
+        ("dispatch (header only)", bench_dict_dispatch, bench_frame_dispatch),
+        ("payload (header + data)", bench_dict_payload, bench_frame_payload),
+    ):
+        print(f"--- {label}")
+        dict_rate, dict_sum = run("TISPacket.parse (dict)", dict_func, frames)
+        frame_rate, frame_sum = run("TISFrame.parse (__slots__)", frame_func, frames)
+        if dict_sum != frame_sum:
+            print("❌ Sonuçlar farklı - çözücüler uyumsuz!")
+            sys.exit(1)
+        print(f"Hızlanma: {frame_rate / dict_rate:.2f}x")
+
+    print("--- CRC verification")
+    table_rate, table_valid = run("calculate_crc_table loop", bench_crc_table, frames)
+    parse_rate, parse_valid = run("TISFrame.parse(verify=True)", bench_crc_verified_parse, frames)
+    batch_rate, batch_valid = run("verify_crc_batch", bench_crc_batch, frames)
+    if not table_valid == parse_valid == batch_valid == len(frames):
+        print("❌ CRC doğrulama sonuçları farklı!")
+        sys.exit(1)
+    print(f"Hızlanma (parse+verify / tablo): {parse_rate / table_rate:.2f}x, batch: {batch_rate / table_rate:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
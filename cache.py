@@ -0,0 +1,191 @@
+"""Persistent caches for the TIS add-on.
+
+Add-on'un kalıcı dizininde (/data) JSON dosyaları olarak tutulur; yeniden
+başlatmalardan sonra da korunur. Yazma işlemleri atomiktir (geçici dosya +
+os.replace), yarım yazılmış bir dosya asla okunmaz.
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('TIS_CACHE_DIR', '/data')
+
+DISCOVERY_CACHE_TTL = 600               # Taze kabul süresi (saniye)
+DISCOVERY_CACHE_MAX_AGE = 7 * 24 * 3600  # Bu süredir görülmeyen cihazlar silinir
+
+
+def atomic_write_json(path: str, data: Any):
+    """Write JSON to path atomically (temp file in the same dir + os.replace)."""
+    atomic_write_text(path, json.dumps(data, indent=2, ensure_ascii=False))
+
+
+def atomic_write_text(path: str, text: str):
+    """Write text to path atomically - readers see the old or the new file, never half."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)  # mkstemp creates 0600
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class JSONCache:
+    """JSON file backed dict, loaded once and saved atomically."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: Dict[str, Any] = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        except Exception as e:
+            _LOGGER.warning(f"Cache {self.path} could not be read, starting empty: {e}")
+            self.data = {}
+
+    def save(self) -> bool:
+        try:
+            atomic_write_json(self.path, self.data)
+            return True
+        except Exception as e:
+            _LOGGER.warning(f"Cache {self.path} could not be written: {e}")
+            return False
+
+    async def save_async(self, io) -> bool:
+        """save() with the file write on an IOWorker; data is serialised on the caller's thread."""
+        text = json.dumps(self.data, indent=2, ensure_ascii=False)
+        try:
+            await io.run(atomic_write_text, self.path, text)
+            return True
+        except Exception as e:
+            _LOGGER.warning(f"Cache {self.path} could not be written: {e}")
+            return False
+
+
+class DiscoveryCache(JSONCache):
+    """Discovered devices with last-seen times (stale-while-revalidate).
+
+    File layout:
+        {"scanned_at": 1700000000.0,
+         "devices": {"tis_1_10": {"host": ..., "subnet": 1, "device": 10, ..., "last_seen": ...}}}
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = DISCOVERY_CACHE_TTL,
+                 max_age: float = DISCOVERY_CACHE_MAX_AGE):
+        self.ttl = ttl
+        self.max_age = max_age
+        super().__init__(path or os.path.join(CACHE_DIR, 'tis_discovery_cache.json'))
+        self.data.setdefault('devices', {})
+        self.data.setdefault('scanned_at', 0)
+
+    @property
+    def devices(self) -> Dict[str, Dict[str, Any]]:
+        return self.data['devices']
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the last completed scan (None if never scanned)."""
+        if not self.data['scanned_at']:
+            return None
+        return max(time.time() - self.data['scanned_at'], 0)
+
+    @property
+    def is_fresh(self) -> bool:
+        age = self.age
+        return age is not None and age < self.ttl
+
+    def device_list(self) -> List[Dict[str, Any]]:
+        """Cached devices, sorted by subnet/device."""
+        return sorted((dict(device) for device in self.devices.values()),
+                      key=lambda d: (d.get('subnet', 0), d.get('device', 0)))
+
+    def touch(self, unique_id: str, device: Dict[str, Any], seen_at: Optional[float] = None):
+        """Insert or refresh one device (no save)."""
+        record = self.devices.setdefault(unique_id, {})
+        record.update(device)
+        record['last_seen'] = seen_at or time.time()
+
+    def update(self, discovered: Dict[str, Dict[str, Any]]):
+        """Merge a completed scan and prune long-unseen devices (no save - see save_async)."""
+        now = time.time()
+        for unique_id, device in discovered.items():
+            self.touch(unique_id, device, now)
+        expired = [uid for uid, device in self.devices.items()
+                   if now - device.get('last_seen', 0) > self.max_age]
+        for unique_id in expired:
+            del self.devices[unique_id]
+        self.data['scanned_at'] = now
+        _LOGGER.info(f"Discovery cache updated: {len(discovered)} seen, {len(self.devices)} cached, {len(expired)} expired")
+
+
+CHANNEL_NAME_CACHE_TTL = 7 * 24 * 3600  # Kanal adları nadiren değişir
+
+
+class ChannelNameCache(JSONCache):
+    """Channel names keyed by device identity (subnet, device, device_type).
+
+    File layout:
+        {"1_20_0x0020": {"names": {"1": "Salon"}, "channels": 48, "last_verified": 1700000000.0}}
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = CHANNEL_NAME_CACHE_TTL):
+        self.ttl = ttl
+        super().__init__(path or os.path.join(CACHE_DIR, 'tis_channel_names.json'))
+
+    @staticmethod
+    def key(subnet: int, device: int, device_type: Optional[int]) -> str:
+        return f"{subnet}_{device}_0x{(device_type or 0):04X}"
+
+    def entry(self, subnet: int, device: int, device_type: Optional[int]) -> Optional[Dict[str, Any]]:
+        return self.data.get(self.key(subnet, device, device_type))
+
+    def get(self, subnet: int, device: int, device_type: Optional[int],
+            channels: Optional[int] = None) -> Optional[Dict[str, str]]:
+        """Cached names, or None when missing, stale or covering fewer channels."""
+        entry = self.entry(subnet, device, device_type)
+        if entry is None:
+            return None
+        if time.time() - entry.get('last_verified', 0) > self.ttl:
+            return None
+        if channels is not None and entry.get('channels', 0) < channels:
+            return None
+        return dict(entry['names'])
+
+    def put(self, subnet: int, device: int, device_type: Optional[int], names: Dict[str, str], channels: int):
+        """Store freshly queried names (no save)."""
+        self.data[self.key(subnet, device, device_type)] = {
+            'names': dict(names),
+            'channels': channels,
+            'last_verified': time.time(),
+        }
+
+    def invalidate(self, subnet: int, device: int, device_type: Optional[int] = None) -> bool:
+        """Drop cached names (all device types when device_type is None, no save); True if any were cached."""
+        if device_type is not None:
+            removed = self.data.pop(self.key(subnet, device, device_type), None) is not None
+        else:
+            prefix = f"{subnet}_{device}_"
+            stale = [key for key in self.data if key.startswith(prefix)]
+            for key in stale:
+                del self.data[key]
+            removed = bool(stale)
+        return removed
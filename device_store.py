@@ -0,0 +1,449 @@
+"""TIS device store - /config/tis_devices.json behind an in-memory index.
+
+Dosya bir kez okunur; sonraki okumalar bellekten yapılır. Her değişiklik tek
+bir yazma kilidi altında uygulanır ve dosya atomik olarak (geçici dosya +
+os.replace) yeniden yazılır, böylece TIS entegrasyonu asla yarım bir dosya
+görmez. Kayıtların JSON gösterimi önbellekte tutulur; bir işlemde sadece
+değişen kayıtlar yeniden serileştirilir.
+
+SQLiteDeviceStore aynı arayüzü /data altındaki bir SQLite (WAL) veritabanı
+ile sağlar; tis_devices.json her işlemden sonra veritabanından dışa aktarılır.
+"""
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from cache import CACHE_DIR, atomic_write_text
+
+_LOGGER = logging.getLogger(__name__)
+
+DEVICES_FILE = '/config/tis_devices.json'
+DEVICES_DB = os.path.join(CACHE_DIR, 'tis_devices.db')
+
+# filter() criteria -> record field
+FILTER_FIELDS = {
+    'subnet': 'subnet',
+    'device_id': 'device_id',
+    'model': 'model_name',
+    'entity_type': 'entity_type',
+    'room': 'room',
+}
+
+
+def _field(record: Dict[str, Any], field: str) -> Any:
+    """Indexed field value; rooms compare as text (ids or names)."""
+    value = record.get(field)
+    return str(value) if field == 'room' and value is not None else value
+
+
+def _encode_record(record: Dict[str, Any]) -> str:
+    """One record as it appears inside the indent=2 top-level object."""
+    # JSON strings never contain a raw newline, so re-indenting is safe
+    return json.dumps(record, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+
+
+class DeviceStore:
+    """Devices added to Home Assistant, keyed by unique_id (tis_{subnet}_{device})."""
+
+    def __init__(self, path: str = DEVICES_FILE):
+        self.path = path
+        self._devices: Dict[str, Dict[str, Any]] = {}
+        self._encoded: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        self._mtime = None
+        # With a FileWatcher attached the file is only stat'ed after invalidate()
+        self.watching = False
+        self._dirty = True
+        self.writes = 0
+        self.reloads = 0
+
+    backend = 'json'
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.backend, 'devices': len(self), 'writes': self.writes, 'reloads': self.reloads}
+
+    def close(self):
+        pass
+
+    def invalidate(self):
+        """The file may have changed on disk; re-check it on the next access."""
+        self._dirty = True
+
+    def _unchanged(self) -> bool:
+        if self.watching and not self._dirty:
+            return True
+        self._dirty = False
+        return False
+
+    # --- okuma ---
+
+    def _stat_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _ensure_loaded(self):
+        """(Re)load when the file changed outside the store (e.g. fix_health_sensor.py)."""
+        if self.reloads and self._unchanged():
+            return
+        mtime = self._stat_mtime()
+        if self.reloads and mtime == self._mtime:
+            return
+        self.reload(mtime)
+
+    def reload(self, mtime: Optional[int] = None):
+        with self._lock:
+            devices = {}
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    devices = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                _LOGGER.warning(f"Could not read existing devices: {e}")
+                return
+            self._devices = devices
+            self._encoded = {}
+            self._mtime = mtime if mtime is not None else self._stat_mtime()
+            self.reloads += 1
+
+    def get(self, unique_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._ensure_loaded()
+            record = self._devices.get(unique_id)
+            return dict(record) if record is not None else None
+
+    def __contains__(self, unique_id: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            return unique_id in self._devices
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._devices)
+
+    def ids(self) -> Set[str]:
+        with self._lock:
+            self._ensure_loaded()
+            return set(self._devices)
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        """Shallow copies of all records."""
+        with self._lock:
+            self._ensure_loaded()
+            return {unique_id: dict(record) for unique_id, record in self._devices.items()}
+
+    def filter(self, **criteria) -> Dict[str, Dict[str, Any]]:
+        """Records matching all given FILTER_FIELDS criteria (None = any)."""
+        wanted = [(FILTER_FIELDS[key], str(value) if key == 'room' else value)
+                  for key, value in criteria.items() if value is not None]
+        with self._lock:
+            self._ensure_loaded()
+            return {unique_id: dict(record) for unique_id, record in self._devices.items()
+                    if all(_field(record, field) == value for field, value in wanted)}
+
+    # --- yazma ---
+
+    def upsert(self, records: Dict[str, Dict[str, Any]]):
+        """Insert or replace records in one write."""
+        if not records:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            devices = dict(self._devices)
+            for unique_id, record in records.items():
+                devices[unique_id] = dict(record)
+            self._write(devices)
+
+    def remove(self, unique_id: str) -> Optional[Dict[str, Any]]:
+        """Delete one record, returns it (None if it did not exist)."""
+        with self._lock:
+            self._ensure_loaded()
+            if unique_id not in self._devices:
+                return None
+            devices = dict(self._devices)
+            record = devices.pop(unique_id)
+            self._write(devices)
+            return dict(record)
+
+    def update_many(self, changes: Dict[str, Dict[str, Any]]) -> int:
+        """Merge field changes {unique_id: {field: value}} in one write; returns records changed."""
+        with self._lock:
+            self._ensure_loaded()
+            devices = dict(self._devices)
+            changed = 0
+            for unique_id, fields in changes.items():
+                record = devices.get(unique_id)
+                if record is None:
+                    continue
+                if any(record.get(key) != value for key, value in fields.items()):
+                    devices[unique_id] = dict(record, **fields)
+                    changed += 1
+            if changed:
+                self._write(devices)
+            return changed
+
+    def modify(self, func: Callable[[str, Dict[str, Any]], Optional[Dict[str, Any]]],
+               unique_ids: Optional[Iterable[str]] = None) -> int:
+        """Compute changes per record under the writer lock and apply them in one write.
+
+        func(unique_id, record) returns a {field: value} dict or None for no change.
+        """
+        with self._lock:
+            records = self.all()
+            changes = {}
+            for unique_id in (unique_ids if unique_ids is not None else list(records)):
+                record = records.get(unique_id)
+                if record is not None:
+                    fields = func(unique_id, record)
+                    if fields:
+                        changes[unique_id] = fields
+            return self.update_many(changes)
+
+    def _write(self, devices: Dict[str, Dict[str, Any]]):
+        """Atomically write devices, then make them the current state.
+
+        Changed records are new dict objects, so only those are re-encoded. If the
+        write fails (disk full, read-only /config) memory keeps the on-disk state.
+        """
+        current = self._devices
+        encoded = {}
+        parts = []
+        for unique_id, record in devices.items():
+            text = self._encoded.get(unique_id) if current.get(unique_id) is record else None
+            if text is None:
+                text = _encode_record(record)
+            encoded[unique_id] = text
+            parts.append(f"  {json.dumps(unique_id, ensure_ascii=False)}: {text}")
+        body = '{\n' + ',\n'.join(parts) + '\n}' if parts else '{}'
+        atomic_write_text(self.path, body)
+        self._devices = devices
+        self._encoded = encoded
+        self._mtime = self._stat_mtime()
+        self.writes += 1
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    unique_id TEXT PRIMARY KEY,
+    subnet INTEGER,
+    device_id INTEGER,
+    model_name TEXT,
+    entity_type TEXT,
+    room TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_devices_address ON devices (subnet, device_id);
+CREATE INDEX IF NOT EXISTS idx_devices_model ON devices (model_name);
+CREATE INDEX IF NOT EXISTS idx_devices_entity_type ON devices (entity_type);
+CREATE INDEX IF NOT EXISTS idx_devices_room ON devices (room);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_UPSERT = """
+INSERT INTO devices (unique_id, subnet, device_id, model_name, entity_type, room, data)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (unique_id) DO UPDATE SET
+    subnet = excluded.subnet, device_id = excluded.device_id, model_name = excluded.model_name,
+    entity_type = excluded.entity_type, room = excluded.room, data = excluded.data
+"""
+
+
+def _row(unique_id: str, record: Dict[str, Any]) -> tuple:
+    return (unique_id, record.get('subnet'), record.get('device_id'), record.get('model_name'),
+            record.get('entity_type'), _field(record, 'room'), _encode_record(record))
+
+
+class SQLiteDeviceStore(DeviceStore):
+    """DeviceStore on an indexed SQLite (WAL) database.
+
+    Rows keep the record's encoded JSON fragment, so the tis_devices.json export
+    after each transaction is a concatenation without re-serialising anything.
+    Edits made directly to the JSON file (integration, fix_health_sensor.py) are
+    imported back on the next access, the same way DeviceStore reloads.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path: str = DEVICES_FILE, db_path: str = DEVICES_DB):
+        super().__init__(path)
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'json_mtime'").fetchone()
+        self._mtime = int(row[0]) if row and row[0] else None
+        self._checked = False
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # --- JSON senkronizasyonu ---
+
+    def _ensure_loaded(self):
+        if self._checked and self._unchanged():
+            return
+        mtime = self._stat_mtime()
+        if self._checked and mtime == self._mtime:
+            return
+        self._checked = True
+        if mtime is None:
+            if self._db.execute('SELECT 1 FROM devices LIMIT 1').fetchone():
+                self._export()  # JSON silinmiş, veritabanından yeniden oluştur
+            return
+        if mtime != self._mtime:
+            self.reload(mtime)
+
+    def reload(self, mtime: Optional[int] = None):
+        """Replace the database contents with tis_devices.json."""
+        with self._lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    devices = json.load(f)
+            except FileNotFoundError:
+                devices = {}
+            except Exception as e:
+                _LOGGER.warning(f"Could not read existing devices: {e}")
+                return
+            mtime = mtime if mtime is not None else self._stat_mtime()
+            with self._transaction():
+                self._db.execute('DELETE FROM devices')
+                self._db.executemany(_UPSERT, [_row(uid, record) for uid, record in devices.items()])
+                self._set_json_mtime(mtime)
+            self._mtime = mtime
+            self.reloads += 1
+            _LOGGER.info(f"Device registry imported {len(devices)} devices from {self.path}")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT, rolled back when the block (or the JSON export) fails."""
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+    def _set_json_mtime(self, mtime: Optional[int]):
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_mtime', ?)",
+                         (str(mtime) if mtime is not None else '',))
+
+    def _export(self):
+        """Write tis_devices.json from the stored fragments (insertion order)."""
+        parts = [f"  {json.dumps(unique_id, ensure_ascii=False)}: {data}"
+                 for unique_id, data in self._db.execute('SELECT unique_id, data FROM devices ORDER BY rowid')]
+        body = '{\n' + ',\n'.join(parts) + '\n}' if parts else '{}'
+        atomic_write_text(self.path, body)
+        self._mtime = self._stat_mtime()
+        self._set_json_mtime(self._mtime)
+        self.writes += 1
+
+    # --- okuma ---
+
+    def get(self, unique_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._ensure_loaded()
+            row = self._db.execute('SELECT data FROM devices WHERE unique_id = ?', (unique_id,)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def __contains__(self, unique_id: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            return self._db.execute('SELECT 1 FROM devices WHERE unique_id = ?', (unique_id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return self._db.execute('SELECT COUNT(*) FROM devices').fetchone()[0]
+
+    def ids(self) -> Set[str]:
+        with self._lock:
+            self._ensure_loaded()
+            return {row[0] for row in self._db.execute('SELECT unique_id FROM devices')}
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._ensure_loaded()
+            return {unique_id: json.loads(data)
+                    for unique_id, data in self._db.execute('SELECT unique_id, data FROM devices ORDER BY rowid')}
+
+    def filter(self, **criteria) -> Dict[str, Dict[str, Any]]:
+        """Indexed lookup; only matching rows are decoded."""
+        where, params = [], []
+        for key, value in criteria.items():
+            if value is None:
+                continue
+            where.append(f"{FILTER_FIELDS[key]} = ?")
+            params.append(str(value) if key == 'room' else value)
+        query = 'SELECT unique_id, data FROM devices'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        with self._lock:
+            self._ensure_loaded()
+            return {unique_id: json.loads(data)
+                    for unique_id, data in self._db.execute(query + ' ORDER BY rowid', params)}
+
+    # --- yazma ---
+
+    def upsert(self, records: Dict[str, Dict[str, Any]]):
+        if not records:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            with self._transaction():
+                self._db.executemany(_UPSERT, [_row(uid, record) for uid, record in records.items()])
+                self._export()
+
+    def remove(self, unique_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self.get(unique_id)
+            if record is None:
+                return None
+            with self._transaction():
+                self._db.execute('DELETE FROM devices WHERE unique_id = ?', (unique_id,))
+                self._export()
+            return record
+
+    def update_many(self, changes: Dict[str, Dict[str, Any]]) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            rows = []
+            for unique_id, fields in changes.items():
+                row = self._db.execute('SELECT data FROM devices WHERE unique_id = ?', (unique_id,)).fetchone()
+                if row is None:
+                    continue
+                record = json.loads(row[0])
+                if any(record.get(key) != value for key, value in fields.items()):
+                    record.update(fields)
+                    rows.append(_row(unique_id, record))
+            if rows:
+                with self._transaction():
+                    self._db.executemany(_UPSERT, rows)
+                    self._export()
+            return len(rows)
+
+
+DEVICE_BACKENDS = ('json', 'sqlite')
+
+
+def open_device_store(backend: str = 'json') -> DeviceStore:
+    """DeviceStore for the configured backend; falls back to JSON if SQLite cannot be opened."""
+    if backend == 'sqlite':
+        try:
+            store = SQLiteDeviceStore()
+            _LOGGER.info(f"Device registry: SQLite ({store.db_path}), exported to {store.path}")
+            return store
+        except sqlite3.Error as e:
+            _LOGGER.error(f"SQLite device registry unavailable, using JSON: {e}")
+    return DeviceStore()
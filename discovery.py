@@ -1,15 +1,71 @@
 """Discovery helpers for TIS devices via UDP - Standalone version."""
+import asyncio
 import logging
 import socket
+import struct
 import time
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Container, Dict, Optional, Tuple
 from const import UDP_PORT, DISCOVERY_TIMEOUT, get_device_info, get_device_description
-from tis_protocol import TISPacket
+from tis_protocol import SMARTCLOUD_MARKER, TISPacket
+from state_engine import ChannelStates
 
 _LOGGER = logging.getLogger(__name__)
 
-def get_local_ip() -> str:
-    """Get local IP address."""
+# SMARTCLOUD envelope cache: the local IP is resolved once and re-resolved only
+# when the interface list changes or LOCAL_IP_MAX_AGE has passed.
+LOCAL_IP_CHECK_INTERVAL = 5.0   # seconds between cheap interface-list checks
+LOCAL_IP_MAX_AGE = 300.0        # force a full re-resolve after this many seconds
+
+_local_ip_cache = {
+    'ip': None,
+    'envelope': None,
+    'interface': None,   # explicit interface name or IPv4 address (multi-homed hosts)
+    'signature': None,   # socket.if_nameindex() snapshot
+    'resolved_at': 0.0,
+    'checked_at': 0.0,
+}
+
+
+def set_local_interface(interface: Optional[str]) -> None:
+    """Pin the SMARTCLOUD source address to an interface name (eth0) or IPv4 address."""
+    _local_ip_cache['interface'] = interface or None
+    _local_ip_cache['ip'] = None  # Force re-resolve on next use
+
+
+def _interface_signature():
+    """Cheap snapshot of the host's interfaces (no routing lookup)."""
+    try:
+        return tuple(socket.if_nameindex())
+    except (AttributeError, OSError):
+        return None
+
+
+def _interface_ip(name: str) -> Optional[str]:
+    """IPv4 address of a named interface (Linux SIOCGIFADDR)."""
+    try:
+        import fcntl
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            packed = fcntl.ioctl(s.fileno(), 0x8915, struct.pack('256s', name[:15].encode()))
+            return socket.inet_ntoa(packed[20:24])
+        finally:
+            s.close()
+    except (ImportError, OSError):
+        return None
+
+
+def _resolve_local_ip() -> str:
+    interface = _local_ip_cache['interface']
+    if interface:
+        try:
+            socket.inet_aton(interface)
+            return interface
+        except OSError:
+            pass
+        local_ip = _interface_ip(interface)
+        if local_ip:
+            return local_ip
+        _LOGGER.warning(f"Interface {interface} has no IPv4 address, falling back to default route")
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.connect(("8.8.8.8", 80))
@@ -19,174 +75,392 @@ def get_local_ip() -> str:
     except Exception:
         return "192.168.1.1"
 
+
+def get_local_ip() -> str:
+    """Get local IP address (cached, refreshed on interface changes)."""
+    now = time.monotonic()
+    cache = _local_ip_cache
+    if cache['ip'] is not None and now - cache['checked_at'] < LOCAL_IP_CHECK_INTERVAL:
+        return cache['ip']
+    
+    cache['checked_at'] = now
+    signature = _interface_signature()
+    if (cache['ip'] is None or signature != cache['signature']
+            or now - cache['resolved_at'] > LOCAL_IP_MAX_AGE):
+        local_ip = _resolve_local_ip()
+        if local_ip != cache['ip']:
+            if cache['ip'] is not None:
+                _LOGGER.info(f"Local IP changed: {cache['ip']} -> {local_ip}")
+            cache['ip'] = local_ip
+            cache['envelope'] = bytes([int(x) for x in local_ip.split('.')]) + SMARTCLOUD_MARKER
+        cache['signature'] = signature
+        cache['resolved_at'] = now
+    return cache['ip']
+
+
+def get_smartcloud_envelope() -> bytes:
+    """[local IP (4)] + SMARTCLOUD prefix for outgoing packets (cached)."""
+    get_local_ip()
+    return _local_ip_cache['envelope']
+
+
 DISCOVERY_OP_CODE = 0xF003
-DISCOVERY_RETRIES = 10
-DISCOVERY_INTERVAL = 1.5
+DISCOVERY_RETRIES = 10          # Upper bound on broadcasts per scan
+DISCOVERY_INTERVAL = 0.5        # First gap between broadcasts (doubles while nothing new arrives)
+DISCOVERY_MAX_INTERVAL = 4.0
+DISCOVERY_MIN_BROADCASTS = 2    # Always repeat at least this many times (UDP loss)
+DISCOVERY_QUIET_WINDOW = 2.0    # Stop once no new device appeared for this long
+DISCOVERY_MAX_DURATION = 20.0
+
+# Son taramanın istatistikleri (/api/info)
+LAST_DISCOVERY_STATS: Dict[str, Any] = {}
+
 
+DISCOVERY_NAME_OP_CODE = 0x000E    # Cihaz adı sorgusu (yanıt 0x000F)
 
-async def discover_tis_devices(gateway_ip: str, udp_port: int = 6000) -> Dict[str, Dict[str, Any]]:
+# Engine events: ('device', info), ('name', info) when a 0x000F name arrives later,
+# and a final ('complete', stats)
+DiscoveryEvent = Tuple[str, Dict[str, Any]]
+
+
+def _decode_device_name(additional_data: bytes) -> Optional[str]:
+    """0x000F yanıtından cihaz adını çöz"""
+    try:
+        null_pos = additional_data.find(0)
+        if null_pos != -1:
+            additional_data = additional_data[:null_pos]
+        return additional_data.decode('utf-8', errors='ignore').strip() or None
+    except Exception:
+        return None
+
+
+def _device_record(parsed, ip: str) -> Optional[Dict[str, Any]]:
+    """Build the device dict for a reply, None for unknown/system devices."""
+    subnet = parsed['src_subnet']
+    device = parsed['src_device']
+    device_type_id = parsed['src_type']
+    model_name, channels = get_device_info(device_type_id)
+    
+    # Skip unknown/system devices (Home Assistant itself)
+    if model_name == "Unknown Device" or device_type_id == 0xFFFE:
+        _LOGGER.debug(f"Skipping system device: {ip} ({subnet}.{device})")
+        return None
+    
+    return {
+        "host": ip,
+        "subnet": subnet,
+        "device": device,
+        "device_type": device_type_id,
+        "device_type_hex": f"0x{device_type_id:04X}",
+        "model_name": model_name,
+        "channels": channels,
+        "name": f"{model_name} ({subnet}.{device})",
+        "description": get_device_description(model_name),
+    }
+
+
+async def iter_discovery(bus, query_names: bool = True, **options) -> AsyncIterator[DiscoveryEvent]:
+    """Stream discovery events from the shared bus.
+    
+    The engine runs as its own task and pushes events into an unbounded queue, so a
+    slow consumer never stalls receiving. Closing the generator cancels the scan.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    task = asyncio.ensure_future(_discovery_engine(bus, events, query_names, **options))
+    try:
+        while True:
+            kind, payload = await events.get()
+            yield kind, payload
+            if kind == 'complete':
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+async def discover_tis_devices(gateway_ip: str, udp_port: int = 6000, **options) -> Dict[str, Dict[str, Any]]:
     """Discover TIS devices on the network."""
-    import asyncio
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _run_discovery, udp_port)
+    from tis_bus import get_bus
+    bus = await get_bus(gateway_ip, udp_port)
+    
+    discovered = {}
+    async for kind, info in iter_discovery(bus, **options):
+        if kind != 'complete':
+            discovered[f"tis_{info['subnet']}_{info['device']}"] = info
+    return discovered
 
 
-def _run_discovery(udp_port: int = 6000) -> Dict[str, Dict[str, Any]]:
-    """Run discovery synchronously."""
+async def _discovery_engine(bus, events: asyncio.Queue, query_names: bool = True,
+                            quiet_window: float = DISCOVERY_QUIET_WINDOW,
+                            min_broadcasts: int = DISCOVERY_MIN_BROADCASTS,
+                            max_broadcasts: int = DISCOVERY_RETRIES,
+                            max_duration: float = DISCOVERY_MAX_DURATION,
+                            skip_names: Container[str] = ()):
+    """Adaptive discovery loop.
+    
+    Broadcasts 0xF003 and listens continuously. The gap between broadcasts doubles
+    whenever a round brings no new device, and the scan ends once min_broadcasts
+    were sent and no new device appeared for quiet_window seconds. Each new device
+    is asked for its name (0x000E) and the 0x000F reply is emitted as a 'name' event;
+    unique_ids in skip_names (devices whose name is already known) are not asked.
+    """
     discovered = {}
-    sock = None
+    started = time.monotonic()
+    first_device_at = None
+    last_new_at = started
+    min_reached_at = None
+    broadcasts = 0
+    responses = 0
+    interval = DISCOVERY_INTERVAL
+    next_broadcast = started
+    round_found = 0
     
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        # Allow multiple processes to bind to same port
-        try:
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-        except (AttributeError, OSError):
-            _LOGGER.debug("SO_REUSEPORT not available on this platform")
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        try:
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
-        except Exception:
-            pass
-            
-        sock.settimeout(0.5)
-        sock.bind(('', udp_port))
-        
-        # Get local IP and prepare SMARTCLOUD header
-        local_ip = get_local_ip()
-        ip_bytes = bytes([int(x) for x in local_ip.split('.')])
-        smartcloud_header = b'SMARTCLOUD'
-        
-        for i in range(DISCOVERY_RETRIES):
-            _LOGGER.info(f"TIS discovery broadcast {i+1}/{DISCOVERY_RETRIES}")
-            
-            packet = TISPacket()
-            packet.op_code = DISCOVERY_OP_CODE
-            packet.tgt_subnet = 255
-            packet.tgt_device = 255
-            tis_data = packet.build()
-            
-            # Add SMARTCLOUD header
-            data = ip_bytes + smartcloud_header + tis_data
-            
-            sock.sendto(data, ('255.255.255.255', udp_port))
-            
-            # Listen for responses
-            sub_end_time = time.time() + DISCOVERY_INTERVAL
-            while time.time() < sub_end_time:
-                try:
-                    data, addr = sock.recvfrom(4096)
-                    ip = addr[0]
+        with bus.subscribe(maxsize=4096) as sub:
+            while True:
+                now = time.monotonic()
+                if now - started >= max_duration:
+                    _LOGGER.info("Discovery reached max duration")
+                    break
+                if min_reached_at is not None and now - max(last_new_at, min_reached_at) >= quiet_window:
+                    break
+                
+                if broadcasts < max_broadcasts and now >= next_broadcast:
+                    if broadcasts and not round_found:
+                        # Yanıtlar yakınsadı - tekrarları seyrekleştir
+                        interval = min(interval * 2, DISCOVERY_MAX_INTERVAL)
+                    round_found = 0
+                    broadcasts += 1
+                    _LOGGER.info(f"TIS discovery broadcast {broadcasts}/{max_broadcasts}")
                     
-                    # Remove SMARTCLOUD header if present
-                    if len(data) > 14 and data[4:14] == b'SMARTCLOUD':
-                        data = data[14:]
+                    packet = TISPacket()
+                    packet.op_code = DISCOVERY_OP_CODE
+                    packet.tgt_subnet = 255
+                    packet.tgt_device = 255
                     
-                    parsed = TISPacket.parse(data)
-                    if parsed:
-                        subnet = parsed['src_subnet']
-                        device = parsed['src_device']
-                        unique_id = f"tis_{subnet}_{device}"
-                        
-                        device_type_id = parsed['src_type']
-                        model_name, channels = get_device_info(device_type_id)
-                        
-                        # Skip unknown/system devices (Home Assistant itself)
-                        if model_name == "Unknown Device" or device_type_id == 0xFFFE:
-                            _LOGGER.debug(f"Skipping system device: {ip} ({subnet}.{device})")
-                            continue
-                        
-                        # Extract device name
-                        device_name_from_packet = None
-                        if parsed['op_code'] == 0x000F and parsed.get('additional_data'):
-                            try:
-                                raw_name = parsed['additional_data']
-                                null_pos = raw_name.find(0)
-                                if null_pos != -1:
-                                    raw_name = raw_name[:null_pos]
-                                device_name_from_packet = raw_name.decode('utf-8', errors='ignore').strip()
-                            except Exception:
-                                pass
-                        
-                        final_name = f"{model_name} ({subnet}.{device})"
-                        if device_name_from_packet:
-                            final_name = f"{device_name_from_packet} ({subnet}.{device})"
-
-                        if unique_id not in discovered:
-                            _LOGGER.info(f"Found: {ip} ({subnet}.{device}) - {model_name}")
-                            discovered[unique_id] = {
-                                "host": ip,
-                                "subnet": subnet,
-                                "device": device,
-                                "device_type": device_type_id,
-                                "device_type_hex": f"0x{device_type_id:04X}",
-                                "model_name": model_name,
-                                "channels": channels,
-                                "name": final_name,
-                                "description": get_device_description(model_name),
-                            }
-                        elif device_name_from_packet:
-                            discovered[unique_id]["name"] = final_name
-                            
-                except socket.timeout:
+                    # Add SMARTCLOUD header
+                    await bus.send(get_smartcloud_envelope() + packet.build(), '255.255.255.255')
+                    next_broadcast = now + interval
+                    if broadcasts == min_broadcasts or (broadcasts == max_broadcasts and min_reached_at is None):
+                        min_reached_at = now
+                
+                # Listen until the next broadcast or the quiet deadline, whichever is first
+                deadline = started + max_duration
+                if broadcasts < max_broadcasts:
+                    deadline = min(deadline, next_broadcast)
+                if min_reached_at is not None:
+                    deadline = min(deadline, max(last_new_at, min_reached_at) + quiet_window)
+                parsed, ip, _ = await sub.get(timeout=deadline - time.monotonic())
+                if not parsed:
                     continue
-                except Exception as e:
-                    _LOGGER.error(f"Socket error: {e}")
-        
-        # Final wait
-        _LOGGER.info("Waiting for final responses...")
-        final_end_time = time.time() + 4.0
-        while time.time() < final_end_time:
-            try:
-                data, addr = sock.recvfrom(4096)
-                ip = addr[0]
+                responses += 1
                 
-                if len(data) > 14 and data[4:14] == b'SMARTCLOUD':
-                    data = data[14:]
+                subnet = parsed['src_subnet']
+                device = parsed['src_device']
+                unique_id = f"tis_{subnet}_{device}"
+                record = discovered.get(unique_id)
                 
-                parsed = TISPacket.parse(data)
-                if parsed:
-                    subnet = parsed['src_subnet']
-                    device = parsed['src_device']
-                    unique_id = f"tis_{subnet}_{device}"
+                if record is None:
+                    record = _device_record(parsed, ip)
+                    if record is None:
+                        continue
+                    _LOGGER.info(f"Found: {ip} ({subnet}.{device}) - {record['model_name']}")
+                    last_new_at = time.monotonic()
+                    if first_device_at is None:
+                        first_device_at = last_new_at
+                    round_found += 1
+                    discovered[unique_id] = record
+                    events.put_nowait(('device', dict(record)))
                     
-                    if unique_id not in discovered:
-                        device_type_id = parsed['src_type']
-                        model_name, channels = get_device_info(device_type_id)
-                        
-                        # Skip unknown/system devices
-                        if model_name == "Unknown Device" or device_type_id == 0xFFFE:
-                            continue
-                        
-                        final_name = f"{model_name} ({subnet}.{device})"
-                        
-                        _LOGGER.info(f"Late discovery: {ip} ({subnet}.{device}) - {model_name}")
-                        discovered[unique_id] = {
-                            "host": ip,
-                            "subnet": subnet,
-                            "device": device,
-                            "device_type": device_type_id,
-                            "device_type_hex": f"0x{device_type_id:04X}",
-                            "model_name": model_name,
-                            "channels": channels,
-                            "name": final_name,
-                            "description": get_device_description(model_name),
-                        }
-                        
-            except socket.timeout:
-                continue
-            except Exception as e:
-                _LOGGER.error(f"Final wait error: {e}")
+                    if query_names and parsed['op_code'] != 0x000F and unique_id not in skip_names:
+                        name_query = TISPacket()
+                        name_query.op_code = DISCOVERY_NAME_OP_CODE
+                        name_query.tgt_subnet = subnet
+                        name_query.tgt_device = device
+                        await bus.send(get_smartcloud_envelope() + name_query.build(), ip)
+                
+                if parsed['op_code'] == 0x000F and parsed.get('additional_data'):
+                    device_name = _decode_device_name(parsed['additional_data'])
+                    final_name = f"{device_name} ({subnet}.{device})" if device_name else None
+                    if final_name and final_name != record['name']:
+                        record['name'] = final_name
+                        events.put_nowait(('name', dict(record)))
         
     except Exception as e:
         _LOGGER.error(f"Discovery error: {e}")
+    
     finally:
-        if sock:
-            sock.close()
+        finished = time.monotonic()
+        LAST_DISCOVERY_STATS.clear()
+        LAST_DISCOVERY_STATS.update({
+            'devices': len(discovered),
+            'broadcasts': broadcasts,
+            'responses': responses,
+            'time_to_first_device': round(first_device_at - started, 3) if first_device_at else None,
+            'time_to_last_device': round(last_new_at - started, 3) if first_device_at else None,
+            'time_to_complete': round(finished - started, 3),
+            'finished_at': time.time(),
+        })
+        _LOGGER.info(f"Discovery complete: {len(discovered)} devices found in {finished - started:.1f}s "
+                     f"({broadcasts} broadcasts, first device after {LAST_DISCOVERY_STATS['time_to_first_device']}s)")
+        events.put_nowait(('complete', dict(LAST_DISCOVERY_STATS)))
+
+
+SWEEP_WINDOW = 16       # Aynı anda yanıt beklenen en fazla ping
+SWEEP_TIMEOUT = 1.0
+SWEEP_RETRIES = 1
+
+
+async def sweep_known_devices(bus, devices: Dict[str, Dict[str, Any]], window: int = SWEEP_WINDOW,
+                              timeout: float = SWEEP_TIMEOUT, retries: int = SWEEP_RETRIES) -> Dict[str, Dict[str, Any]]:
+    """Unicast liveness check of known devices.
     
-    _LOGGER.info(f"Discovery complete: {len(discovered)} devices found")
-    return discovered
+    Sends a targeted 0xF003 to each device (to its last known host) and waits for
+    its 0xF004, with at most `window` pings in flight. Returns
+    {unique_id: {'online': bool, 'rtt_ms': float or None, 'checked_at': ts}}.
+    """
+    semaphore = asyncio.Semaphore(max(window, 1))
+    
+    async def ping(unique_id: str, device: Dict[str, Any]):
+        async with semaphore:
+            for _ in range(retries + 1):
+                sent_at = time.monotonic()
+                parsed = await bus.request(device['subnet'], device['device'], DISCOVERY_OP_CODE,
+                                           timeout=timeout, ip=device.get('host'))
+                if parsed is not None:
+                    rtt_ms = round((time.monotonic() - sent_at) * 1000, 1)
+                    return unique_id, {'online': True, 'rtt_ms': rtt_ms, 'checked_at': time.time()}
+        return unique_id, {'online': False, 'rtt_ms': None, 'checked_at': time.time()}
+    
+    started = time.monotonic()
+    results = dict(await asyncio.gather(*(ping(uid, device) for uid, device in devices.items())))
+    online = sum(1 for result in results.values() if result['online'])
+    _LOGGER.info(f"Liveness sweep: {online}/{len(results)} online in {time.monotonic() - started:.1f}s")
+    return results
+
+
+async def rescan_tis_devices(gateway_ip: str, known: Dict[str, Dict[str, Any]], udp_port: int = 6000,
+                             find_new: bool = True, **sweep_options) -> Dict[str, Any]:
+    """Differential rescan: unicast sweep of known devices, one broadcast for new ones.
+    
+    Returns {'devices': {uid: record + online/rtt_ms}, 'new': {uid: record}}.
+    """
+    from tis_bus import get_bus
+    bus = await get_bus(gateway_ip, udp_port)
+    
+    liveness = await sweep_known_devices(bus, known, **sweep_options)
+    devices = {uid: dict(known[uid], **result) for uid, result in liveness.items()}
+    
+    new_devices = {}
+    if find_new:
+        # Tek broadcast - bilinen cihazlar zaten yoklandı, sadece yenileri aranır
+        # (ad sorgusu da sadece yeni cihazlara gider)
+        async for kind, info in iter_discovery(bus, min_broadcasts=1, max_broadcasts=1, skip_names=known):
+            if kind == 'complete':
+                break
+            unique_id = f"tis_{info['subnet']}_{info['device']}"
+            if unique_id not in known:
+                new_devices[unique_id] = info
+            elif not devices[unique_id]['online']:
+                # Yoklamada kaçan ama broadcast'e yanıt veren cihaz
+                devices[unique_id].update(online=True, host=info['host'])
+    
+    return {'devices': devices, 'new': new_devices}
+
+
+PASSIVE_SAVE_INTERVAL = 30.0
+
+
+class PassiveDiscovery:
+    """Device inventory built from ordinary bus traffic - zero broadcasts.
+    
+    Every frame carries src_subnet/src_device/src_type, so any device that talks on
+    the bus is added to (or refreshed in) the discovery cache. The cache is saved at
+    most every save_interval seconds, on the given IOWorker (never on the loop).
+    While the listener runs, the cache's scanned_at is kept current so /api/devices
+    reports it as fresh.
+    """
+    
+    def __init__(self, bus, cache, io, save_interval: float = PASSIVE_SAVE_INTERVAL):
+        self.bus = bus
+        self.cache = cache
+        self.io = io
+        self.save_interval = save_interval
+        self.frames_seen = 0
+        self.devices_found = 0
+        self._dirty = False
+        self._task = None
+    
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'frames_seen': self.frames_seen,
+            'devices_found': self.devices_found,
+        }
+    
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+            _LOGGER.info("Passive discovery started")
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._flush()
+    
+    async def _flush(self):
+        """Mark the inventory as current; write it only when it changed."""
+        self.cache.data['scanned_at'] = time.time()
+        if self._dirty:
+            self._dirty = False
+            await self.cache.save_async(self.io)
+    
+    def observe(self, parsed, ip: str):
+        """Record the sender of one frame."""
+        self.frames_seen += 1
+        unique_id = f"tis_{parsed['src_subnet']}_{parsed['src_device']}"
+        record = self.cache.devices.get(unique_id)
+        if record is None:
+            record = _device_record(parsed, ip)
+            if record is None:
+                return
+            record['source'] = 'passive'
+            self.cache.touch(unique_id, record)
+            self.devices_found += 1
+            _LOGGER.info(f"Passive discovery: {ip} ({record['subnet']}.{record['device']}) - {record['model_name']}")
+        else:
+            record['last_seen'] = time.time()
+            record['host'] = ip
+        
+        if parsed['op_code'] == 0x000F and parsed.get('additional_data'):
+            device_name = _decode_device_name(parsed['additional_data'])
+            if device_name:
+                record['name'] = f"{device_name} ({parsed['src_subnet']}.{parsed['src_device']})"
+        self._dirty = True
+    
+    async def _run(self):
+        last_save = time.monotonic()
+        with self.bus.subscribe(maxsize=1024) as sub:
+            while True:
+                parsed, ip, _ = await sub.get(timeout=self.save_interval)
+                if parsed:
+                    try:
+                        self.observe(parsed, ip)
+                    except Exception as e:
+                        _LOGGER.debug(f"Passive discovery skip: {e}")
+                if time.monotonic() - last_save >= self.save_interval:
+                    await self._flush()
+                    last_save = time.monotonic()
 
 
 class TISDiscovery:
@@ -196,435 +470,223 @@ class TISDiscovery:
         self.gateway_ip = gateway_ip
         self.udp_port = udp_port
     
-    async def discover_with_callback(self, on_device_found):
-        """Discover devices and call callback for each device found."""
-        import asyncio
-        loop = asyncio.get_event_loop()
+    async def discover_with_callback(self, on_device_found, on_device_updated=None):
+        """Discover devices and call callback for each device found.
+        
+        Callbacks are awaited from the consumer side of the engine, so a slow
+        callback delays only later callbacks, never packet reception.
+        """
+        from tis_bus import get_bus
         
         discovered = {}
         
-        def discovery_worker():
-            sock = None
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                # Allow multiple processes to bind to same port
+        try:
+            bus = await get_bus(self.gateway_ip, self.udp_port)
+            async for kind, info in iter_discovery(bus):
+                if kind == 'complete':
+                    break
+                unique_id = f"tis_{info['subnet']}_{info['device']}"
+                discovered[unique_id] = info
+                callback = on_device_found if kind == 'device' else on_device_updated
+                if callback is None:
+                    continue
                 try:
-                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-                except (AttributeError, OSError):
-                    _LOGGER.debug("SO_REUSEPORT not available on this platform")
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-                sock.settimeout(0.5)
-                sock.bind(('', self.udp_port))
-                
-                local_ip = get_local_ip()
-                ip_bytes = bytes([int(x) for x in local_ip.split('.')])
-                smartcloud_header = b'SMARTCLOUD'
-                
-                for i in range(DISCOVERY_RETRIES):
-                    packet = TISPacket()
-                    packet.op_code = DISCOVERY_OP_CODE
-                    packet.tgt_subnet = 255
-                    packet.tgt_device = 255
-                    tis_data = packet.build()
-                    data = ip_bytes + smartcloud_header + tis_data
-                    sock.sendto(data, ('255.255.255.255', self.udp_port))
-                    
-                    sub_end_time = time.time() + DISCOVERY_INTERVAL
-                    while time.time() < sub_end_time:
-                        try:
-                            data, addr = sock.recvfrom(4096)
-                            ip = addr[0]
-                            
-                            if len(data) > 14 and data[4:14] == b'SMARTCLOUD':
-                                data = data[14:]
-                            
-                            parsed = TISPacket.parse(data)
-                            if parsed:
-                                subnet = parsed['src_subnet']
-                                device_id = parsed['src_device']
-                                unique_id = f"tis_{subnet}_{device_id}"
-                                
-                                device_type_id = parsed['src_type']
-                                model_name, channels = get_device_info(device_type_id)
-                                
-                                if model_name == "Unknown Device" or device_type_id == 0xFFFE:
-                                    continue
-                                
-                                if unique_id not in discovered:
-                                    device_info = {
-                                        "host": ip,
-                                        "subnet": subnet,
-                                        "device": device_id,
-                                        "device_type": device_type_id,
-                                        "device_type_hex": f"0x{device_type_id:04X}",
-                                        "model_name": model_name,
-                                        "channels": channels,
-                                        "name": f"{model_name} ({subnet}.{device_id})",
-                                        "description": get_device_description(model_name),
-                                    }
-                                    discovered[unique_id] = device_info
-                                    
-                                    # Trigger callback immediately
-                                    try:
-                                        future = asyncio.run_coroutine_threadsafe(
-                                            on_device_found(device_info), 
-                                            loop
-                                        )
-                                        future.result(timeout=0.1)  # Wait briefly for callback
-                                    except Exception as e:
-                                        _LOGGER.error(f"Callback error for {unique_id}: {e}")
-                                    
-                        except socket.timeout:
-                            continue
-                        except Exception as e:
-                            _LOGGER.error(f"Socket error: {e}")
-                
-            except Exception as e:
-                _LOGGER.error(f"Discovery error: {e}")
-            finally:
-                if sock:
-                    sock.close()
+                    await callback(info)
+                except Exception as e:
+                    _LOGGER.error(f"Callback error for {unique_id}: {e}")
             
-            return discovered
+        except Exception as e:
+            _LOGGER.error(f"Discovery error: {e}")
         
-        # Run in executor to not block event loop
-        return await loop.run_in_executor(None, discovery_worker)
+        return discovered
 
 
-async def query_all_channel_names(gateway_ip: str, subnet: int, device_id: int, channels: int = 24, udp_port: int = 6000) -> Dict[str, str]:
-    """Query all channel names with strict response validation.
+def _decode_channel_name(additional_data: bytes):
+    """0xF00F yanıtını çöz - (kanal, ad veya None) döndür.
     
-    STRATEGY: Use SINGLE socket for all queries to avoid port conflicts.
-    Send all queries first, then collect responses with channel validation.
+    Tanımsız kanallar (boş veya 0xFF ile başlayan) için ad None'dır.
     """
-    import asyncio
-    from tis_protocol import TISUDPClient
+    resp_channel = additional_data[0]
+    name_bytes = additional_data[1:]
+    if len(name_bytes) == 0 or name_bytes[0] == 0xFF:
+        return resp_channel, None
+    
+    null_idx = name_bytes.find(b'\x00')
+    if null_idx > 0:
+        name_bytes = name_bytes[:null_idx]
+    try:
+        channel_name = name_bytes.decode('utf-8').strip()
+    except UnicodeDecodeError as decode_err:
+        _LOGGER.warning(f"⚠️ CH{resp_channel} decode error: {decode_err}")
+        return resp_channel, None
+    return resp_channel, channel_name or None
+
+
+CHANNEL_NAME_WINDOW = 8       # Aynı anda yanıt beklenen 0xF00E sorgusu
+CHANNEL_NAME_TIMEOUT = 1.0    # Sorgu başına yanıt süresi (sonra yeniden gönderilir)
+CHANNEL_NAME_RETRIES = 3      # Kanal başına yeniden gönderim
+
+
+async def query_all_channel_names(gateway_ip: str, subnet: int, device_id: int, channels: int = 24, udp_port: int = 6000,
+                                  correlator=None, window: int = CHANNEL_NAME_WINDOW,
+                                  timeout: float = CHANNEL_NAME_TIMEOUT,
+                                  retries: int = CHANNEL_NAME_RETRIES) -> Dict[str, str]:
+    """Query all channel names with a sliding-window pipeline.
+    
+    `window` workers share a queue of channels, so N 0xF00E queries are in flight and
+    the next one goes out as soon as a 0xF00F reply (matched per channel on the
+    TISRequestCorrelator) arrives. A channel whose reply times out is queued again,
+    up to `retries` times. Defaults to the correlator of the shared TIS bus.
+    """
+    from collections import deque
+    from tis_bus import get_bus
     
     _LOGGER.info(f"🔍 Starting channel name query for {subnet}.{device_id}")
     channel_names = {}
     received_channels = set()
+    todo = deque(range(1, channels + 1))
+    attempts = {}
     
-    client = None
-    try:
-        # Single socket for all operations
-        client = TISUDPClient(gateway_ip, udp_port)
-        await client.async_connect(bind=True)  # Bind to receive
-        client.sock.setblocking(False)  # Non-blocking mode
-        
-        # Get local IP for SMARTCLOUD header
-        local_ip = get_local_ip()
-        ip_bytes = bytes([int(x) for x in local_ip.split('.')])
-        
-        # PHASE 1: Send all queries with delays
-        _LOGGER.info(f"📤 Sending queries for {channels} channels...")
-        for channel in range(1, channels + 1):
-            packet = TISPacket()
-            packet.src_subnet = 1
-            packet.src_device = 254
-            packet.src_type = 0xFFFE
-            packet.tgt_subnet = subnet
-            packet.tgt_device = device_id
-            packet.op_code = 0xF00E
-            packet.additional_data = bytes([channel])  # 1-24 format
-            
-            tis_data = packet.build()
-            full_packet = ip_bytes + b'SMARTCLOUD' + tis_data
-            
-            client.send_to(full_packet, gateway_ip)
-            _LOGGER.debug(f"📤 Query CH{channel}")
-            
-            # Small delay between queries to avoid flooding (200ms to reduce packet loss)
-            await asyncio.sleep(0.2)
-        
-        # PHASE 2: Collect responses (up to 15 seconds total)
-        _LOGGER.info(f"📥 Collecting responses...")
-        timeout = 15.0
-        start_time = time.time()
-        last_response_time = start_time
-        
-        while time.time() - start_time < timeout:
-            try:
-                # Try to receive data
-                data, addr = await asyncio.wait_for(
-                    asyncio.get_event_loop().sock_recvfrom(client.sock, 1024),
-                    timeout=0.3
-                )
-                
-                last_response_time = time.time()
-                
-                # Parse response
-                if b'SMARTCLOUD' in data:
-                    idx = data.find(b'SMARTCLOUD')
-                    tis_data = data[idx + 10:]
-                else:
-                    tis_data = data
-                
-                parsed = TISPacket.parse(tis_data)
-                
-                if parsed and parsed['op_code'] == 0xF00F:
-                    if len(parsed['additional_data']) >= 1:
-                        resp_channel = parsed['additional_data'][0]
-                        
-                        # DEBUG: Log all responses
-                        _LOGGER.info(f"📨 Response OpCode 0xF00F: CH{resp_channel}, data_len={len(parsed['additional_data'])}")
-                        
-                        # Check if we already processed this channel
-                        if resp_channel in received_channels:
-                            _LOGGER.warning(f"⚠️ Duplicate response for CH{resp_channel}, ignoring")
-                            continue
-                        
-                        if len(parsed['additional_data']) >= 2:
-                            name_bytes = parsed['additional_data'][1:]
-                            
-                            # DEBUG: Log raw bytes
-                            _LOGGER.debug(f"CH{resp_channel} raw bytes: {name_bytes.hex()}")
-                            
-                            # Check if undefined (0xFF pattern or empty)
-                            if len(name_bytes) == 0 or name_bytes[0] == 0xFF:
-                                _LOGGER.debug(f"CH{resp_channel}: undefined (0xFF)")
-                                received_channels.add(resp_channel)
-                            else:
-                                # Decode UTF-8 name
-                                try:
-                                    null_idx = name_bytes.find(b'\x00')
-                                    if null_idx > 0:
-                                        name_bytes = name_bytes[:null_idx]
-                                    
-                                    channel_name = name_bytes.decode('utf-8').strip()
-                                    if channel_name:
-                                        channel_names[str(resp_channel)] = channel_name
-                                        received_channels.add(resp_channel)
-                                        _LOGGER.info(f"✅ CH{resp_channel}: '{channel_name}'")
-                                    else:
-                                        received_channels.add(resp_channel)
-                                        
-                                except Exception as decode_err:
-                                    _LOGGER.warning(f"⚠️ CH{resp_channel} decode error: {decode_err}")
-                                    received_channels.add(resp_channel)
-                
-                # If we got all channels, break early
-                if len(received_channels) >= channels:
-                    _LOGGER.info(f"🎉 All {channels} channels received!")
-                    break
-                    
-            except asyncio.TimeoutError:
-                # No data in this window
-                # If no response for 3 seconds, stop waiting
-                if time.time() - last_response_time > 3.0:
-                    _LOGGER.info(f"⏱️ No response for 3s, stopping collection")
-                    break
+    async def worker():
+        while todo:
+            channel = todo.popleft()
+            attempts[channel] = attempts.get(channel, 0) + 1
+            parsed = await correlator.request(subnet, device_id, 0xF00E, bytes([channel]), timeout=timeout)
+            if parsed is None or len(parsed['additional_data']) < 1:
+                if attempts[channel] <= retries:
+                    _LOGGER.debug(f"🔄 Retry CH{channel}")
+                    todo.append(channel)
                 continue
+            resp_channel, channel_name = _decode_channel_name(parsed['additional_data'])
+            received_channels.add(resp_channel)
+            if channel_name:
+                channel_names[str(resp_channel)] = channel_name
+                _LOGGER.info(f"✅ CH{resp_channel}: '{channel_name}'")
+            else:
+                _LOGGER.debug(f"CH{resp_channel}: undefined (0xFF)")
+    
+    try:
+        if correlator is None:
+            correlator = (await get_bus(gateway_ip, udp_port)).correlator
         
-        # PHASE 3: Retry missing channels
-        missing_channels = []
-        for ch in range(1, channels + 1):
-            if ch not in received_channels:
-                missing_channels.append(ch)
-        
-        if missing_channels and len(missing_channels) <= 5:
-            _LOGGER.warning(f"⚠️ Missing {len(missing_channels)} channels: {missing_channels}, retrying...")
-            
-            for channel in missing_channels:
-                packet = TISPacket()
-                packet.src_subnet = 1
-                packet.src_device = 254
-                packet.src_type = 0xFFFE
-                packet.tgt_subnet = subnet
-                packet.tgt_device = device_id
-                packet.op_code = 0xF00E
-                packet.additional_data = bytes([channel])
-                
-                tis_data = packet.build()
-                full_packet = ip_bytes + b'SMARTCLOUD' + tis_data
-                
-                client.send_to(full_packet, gateway_ip)
-                _LOGGER.debug(f"🔄 Retry CH{channel}")
-                await asyncio.sleep(0.3)
-            
-            # Collect retry responses
-            retry_timeout = 5.0
-            retry_start = time.time()
-            
-            while time.time() - retry_start < retry_timeout:
-                try:
-                    data = await asyncio.wait_for(
-                        asyncio.get_event_loop().sock_recvfrom(client.sock, 1024),
-                        timeout=0.5
-                    )
-                    data = data[0]
-                    
-                    if b'SMARTCLOUD' in data:
-                        idx = data.find(b'SMARTCLOUD')
-                        tis_data = data[idx + 10:]
-                    else:
-                        tis_data = data
-                    
-                    parsed = TISPacket.parse(tis_data)
-                    
-                    if parsed and parsed['op_code'] == 0xF00F:
-                        if len(parsed['additional_data']) >= 1:
-                            resp_channel = parsed['additional_data'][0]
-                            
-                            if resp_channel in missing_channels and resp_channel not in received_channels:
-                                if len(parsed['additional_data']) >= 2:
-                                    name_bytes = parsed['additional_data'][1:]
-                                    
-                                    if len(name_bytes) > 0 and name_bytes[0] != 0xFF:
-                                        try:
-                                            null_idx = name_bytes.find(b'\x00')
-                                            if null_idx > 0:
-                                                name_bytes = name_bytes[:null_idx]
-                                            
-                                            channel_name = name_bytes.decode('utf-8').strip()
-                                            if channel_name:
-                                                channel_names[str(resp_channel)] = channel_name
-                                                received_channels.add(resp_channel)
-                                                _LOGGER.info(f"✅ CH{resp_channel} (retry): '{channel_name}'")
-                                        except:
-                                            pass
-                                    else:
-                                        received_channels.add(resp_channel)
-                
-                except asyncio.TimeoutError:
-                    continue
+        started = time.monotonic()
+        _LOGGER.info(f"📤 Querying {channels} channels, window {window}...")
+        await asyncio.gather(*(worker() for _ in range(max(1, min(window, channels)))))
         
-        _LOGGER.info(f"🎯 Query complete: {len(channel_names)}/{channels} names, {len(received_channels)} responses")
+        missing_channels = [ch for ch in range(1, channels + 1) if ch not in received_channels]
+        if missing_channels:
+            _LOGGER.warning(f"⚠️ No reply after {retries} retries: {missing_channels}")
+        sent = sum(attempts.values())
+        _LOGGER.info(f"🎯 Query complete: {len(channel_names)}/{channels} names, {len(received_channels)} responses, "
+                     f"{sent - channels} retransmits, {time.monotonic() - started:.2f}s")
         
     except Exception as e:
         _LOGGER.error(f"❌ Channel name query error: {e}")
         
-    finally:
-        if client:
-            try:
-                client.close()
-            except:
-                pass
     
     return channel_names
 
 
-async def query_device_initial_states(gateway_ip: str, subnet: int, device_id: int, channels: int = 24, udp_port: int = 6000) -> Dict[int, Dict[str, Any]]:
+async def query_device_initial_states(gateway_ip: str, subnet: int, device_id: int, channels: int = 24, udp_port: int = 6000,
+                                      correlator=None) -> ChannelStates:
     """Query all channel states with OpCode 0x0033/0x0034.
     
-    Returns dict with channel number as key:
-    {
-        1: {'is_on': True, 'brightness': 85, 'raw_value': 216},
-        2: {'is_on': False, 'brightness': 0, 'raw_value': 0},
-        ...
-    }
+    Returns ChannelStates (one raw byte per channel, empty on failure);
+    states.raw(1), states.is_on(1), states.brightness(1) give per-channel views.
     """
-    import asyncio
-    from tis_protocol import TISUDPClient
+    from tis_bus import get_bus
     
     _LOGGER.info(f"🔍 Querying initial states for {subnet}.{device_id}")
     
-    retry_count = 0
     max_retries = 3
-    
-    while retry_count < max_retries:
-        client = None
-        try:
-            client = TISUDPClient(gateway_ip, udp_port)
-            await client.async_connect(bind=True)
-            client.sock.setblocking(False)
-            
-            # Get local IP for SMARTCLOUD header
-            local_ip = get_local_ip()
-            ip_bytes = bytes([int(x) for x in local_ip.split('.')])
-            
-            # Build OpCode 0x0033 query (all channel states)
-            packet = TISPacket()
-            packet.src_subnet = 1
-            packet.src_device = 254
-            packet.src_type = 0xFFFE
-            packet.tgt_subnet = subnet
-            packet.tgt_device = device_id
-            packet.op_code = 0x0033
-            packet.additional_data = bytes()  # No data needed
-            
-            tis_data = packet.build()
-            full_packet = ip_bytes + b'SMARTCLOUD' + tis_data
-            
-            # Send query
-            client.send_to(full_packet, gateway_ip)
-            _LOGGER.debug(f"📤 Sent OpCode 0x0033 (state query)")
-            
-            # Wait for OpCode 0x0034 response
-            response_timeout = 5.0
-            start_time = time.time()
+    try:
+        if correlator is None:
+            correlator = (await get_bus(gateway_ip, udp_port)).correlator
+        
+        for retry_count in range(max_retries):
+            parsed = await correlator.request(subnet, device_id, 0x0033, timeout=5.0)
             
-            while time.time() - start_time < response_timeout:
-                try:
-                    data, addr = await asyncio.wait_for(
-                        asyncio.get_event_loop().sock_recvfrom(client.sock, 1024),
-                        timeout=0.5
-                    )
-                    
-                    # Parse response
-                    if b'SMARTCLOUD' in data:
-                        idx = data.find(b'SMARTCLOUD')
-                        tis_data = data[idx + 10:]
-                    else:
-                        tis_data = data
-                    
-                    parsed = TISPacket.parse(tis_data)
-                    
-                    if parsed and parsed['op_code'] == 0x0034:
-                        # Response format: additional_data[0] = channel_count, additional_data[1..24] = channel states
-                        state_bytes = parsed.get('additional_data', bytes())
-                        
-                        # DEBUG: Log raw response
-                        _LOGGER.debug(f"OpCode 0x0034 response: {state_bytes.hex()}")
-                        _LOGGER.debug(f"Response length: {len(state_bytes)} bytes (expected {channels + 1})")
-                        
-                        # First byte is channel count, skip it
-                        if len(state_bytes) >= channels + 1:
-                            channel_count = state_bytes[0]
-                            _LOGGER.debug(f"Channel count byte: 0x{channel_count:02X} ({channel_count})")
-                            
-                            states = {}
-                            for ch in range(channels):
-                                raw_value = state_bytes[ch + 1]  # Skip first byte (channel count)
-                                
-                                # Convert to state info
-                                is_on = raw_value > 0
-                                brightness = int((raw_value / 255.0) * 100) if raw_value > 0 else 0
-                                
-                                states[ch + 1] = {  # Channel 1-24
-                                    'is_on': is_on,
-                                    'brightness': brightness,
-                                    'raw_value': raw_value
-                                }
-                                
-                                # DEBUG: Log non-zero channels
-                                if raw_value > 0:
-                                    _LOGGER.debug(f"  CH{ch + 1}: ON (raw={raw_value}, brightness={brightness}%)")
-                            
-                            _LOGGER.info(f"✅ Got {len(states)} channel states")
-                            return states
-                        else:
-                            _LOGGER.warning(f"⚠️ Invalid state response: {len(state_bytes)} bytes (expected {channels + 1})")
+            if parsed is None:
+                _LOGGER.warning(f"⏱️ State query timeout, retry {retry_count + 1}/{max_retries}")
+            else:
+                state_bytes = parsed.get('additional_data', bytes())
+                _LOGGER.debug(f"OpCode 0x0034 response: {state_bytes.hex()}")
                 
-                except asyncio.TimeoutError:
-                    continue
-            
-            _LOGGER.warning(f"⏱️ State query timeout, retry {retry_count + 1}/{max_retries}")
-            retry_count += 1
-            
-        except Exception as e:
-            _LOGGER.error(f"❌ State query error: {e}")
-            retry_count += 1
-            
-        finally:
-            if client:
-                try:
-                    client.close()
-                except:
-                    pass
+                states = ChannelStates.from_status(state_bytes, channels)
+                if states is not None:
+                    _LOGGER.info(f"✅ Got {len(states)} channel states")
+                    return states
+                
+                _LOGGER.warning(f"⚠️ Invalid state response: {len(state_bytes)} bytes (expected {channels + 1})")
             
-            if retry_count < max_retries:
+            if retry_count + 1 < max_retries:
                 await asyncio.sleep(1.0)
     
+    except Exception as e:
+        _LOGGER.error(f"❌ State query error: {e}")
+    
+    
     _LOGGER.error(f"❌ Failed to query states after {max_retries} retries")
-    return {}
+    return ChannelStates()
+
+
+SNAPSHOT_WINDOW = 16       # Aynı anda yanıt beklenen 0x0033 sorgusu
+SNAPSHOT_TIMEOUT = 1.0     # Sorgu başına yanıt süresi (sonra yeniden gönderilir)
+SNAPSHOT_RETRIES = 2
+SNAPSHOT_DEADLINE = 15.0   # Tüm anlık görüntü için üst sınır
+
+
+async def snapshot_device_states(correlator, devices: Dict[str, Dict[str, Any]], window: int = SNAPSHOT_WINDOW,
+                                 timeout: float = SNAPSHOT_TIMEOUT, retries: int = SNAPSHOT_RETRIES,
+                                 deadline: float = SNAPSHOT_DEADLINE) -> Dict[str, Dict[str, Any]]:
+    """Collect 0x0034 multi-channel states from many devices at once.
+    
+    `window` workers share a queue of devices, so that many 0x0033 queries are in
+    flight. A device whose reply times out is queued again (up to `retries` times)
+    behind the others. Nothing new is sent after `deadline` seconds.
+    
+    devices: {unique_id: {'subnet', 'device', 'channels'}}
+    Returns {unique_id: {'subnet', 'device', 'online', 'states' (ChannelStates), 'rtt_ms', 'attempts'}}.
+    """
+    from collections import deque
+    
+    started = time.monotonic()
+    end_time = started + deadline
+    todo = deque(devices)
+    results = {
+        unique_id: {'subnet': device['subnet'], 'device': device['device'], 'online': False,
+                    'states': None, 'rtt_ms': None, 'attempts': 0}
+        for unique_id, device in devices.items()
+    }
+    
+    async def worker():
+        while todo:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                return
+            unique_id = todo.popleft()
+            device = devices[unique_id]
+            result = results[unique_id]
+            result['attempts'] += 1
+            
+            sent_at = time.monotonic()
+            parsed = await correlator.request(device['subnet'], device['device'], 0x0033,
+                                              timeout=min(timeout, remaining), ip=device.get('host'))
+            if parsed is None:
+                if result['attempts'] <= retries:
+                    todo.append(unique_id)
+                continue
+            
+            result['online'] = True
+            result['rtt_ms'] = round((time.monotonic() - sent_at) * 1000, 1)
+            state_bytes = parsed.get('additional_data', bytes())
+            result['states'] = ChannelStates.from_status(state_bytes, device.get('channels'))
+            if result['states'] is None:
+                # Beklenenden kısa yanıt - cihazın bildirdiği kanal sayısıyla çöz
+                result['states'] = ChannelStates.from_status(state_bytes)
+    
+    await asyncio.gather(*(worker() for _ in range(max(1, min(window, len(devices))))))
+    
+    answered = sum(1 for result in results.values() if result['online'])
+    _LOGGER.info(f"📸 State snapshot: {answered}/{len(devices)} devices in {time.monotonic() - started:.1f}s")
+    return results
@@ -0,0 +1,136 @@
+"""File change notifications for the device registry.
+
+Linux'ta inotify (ctypes, ek bağımlılık yok) dosyanın bulunduğu dizini izler;
+atomik os.replace yazmaları da (IN_MOVED_TO) yakalanır. inotify yoksa dosyanın
+mtime değeri belirli aralıklarla kontrol edilir.
+"""
+import asyncio
+import ctypes
+import logging
+import os
+import struct
+from typing import Any, Callable, Dict, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+MTIME_POLL_INTERVAL = 2.0  # inotify yokken kontrol aralığı (saniye)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+def _inotify_libc():
+    """libc with inotify symbols (glibc or musl), None when unavailable."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, 'inotify_init1') and hasattr(libc, 'inotify_add_watch') else None
+
+
+def _stat_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class FileWatcher:
+    """Calls callback() on the event loop whenever path is written, replaced or deleted."""
+
+    def __init__(self, path: str, callback: Callable[[], Any], poll_interval: float = MTIME_POLL_INTERVAL):
+        self.path = path
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.mode = None
+        self.events = 0
+        self._name = os.fsencode(os.path.basename(path))
+        self._fd = None
+        self._task = None
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {'mode': self.mode, 'events': self.events}
+
+    def start(self):
+        if self.mode is not None:
+            return
+        if self._start_inotify():
+            self.mode = 'inotify'
+        else:
+            self.mode = 'mtime'
+            self._task = asyncio.ensure_future(self._poll())
+        _LOGGER.info(f"Watching {self.path} ({self.mode})")
+
+    def stop(self):
+        if self._fd is not None:
+            asyncio.get_event_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.mode = None
+
+    def _start_inotify(self) -> bool:
+        libc = _inotify_libc()
+        if libc is None:
+            return False
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            _LOGGER.debug(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+            return False
+        directory = os.path.dirname(self.path) or '.'
+        if libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            _LOGGER.debug(f"inotify_add_watch({directory}) failed: {os.strerror(ctypes.get_errno())}")
+            os.close(fd)
+            return False
+        self._fd = fd
+        asyncio.get_event_loop().add_reader(fd, self._on_readable)
+        return True
+
+    def _on_readable(self):
+        changed = False
+        while True:
+            try:
+                data = os.read(self._fd, 4096)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += _EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW or name == self._name:
+                    changed = True
+        # Bir okumadaki tüm olaylar tek bir bildirimde birleşir
+        if changed:
+            self._notify()
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        last = await loop.run_in_executor(None, _stat_mtime, self.path)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            mtime = await loop.run_in_executor(None, _stat_mtime, self.path)
+            if mtime != last:
+                last = mtime
+                self._notify()
+
+    def _notify(self):
+        self.events += 1
+        try:
+            self.callback()
+        except Exception as e:
+            _LOGGER.warning(f"File watch callback failed: {e}")
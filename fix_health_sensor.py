@@ -1,34 +1,34 @@
 #!/usr/bin/env python3
 """Fix TIS-HEALTH-CM entity_type in devices JSON."""
 
-import json
+import os
 import sys
 
-# Path to devices file
-DEVICES_FILE = "/config/tis_devices.json"
+from device_store import DEVICES_FILE, DeviceStore
 
 try:
+    if not os.path.exists(DEVICES_FILE):
+        raise FileNotFoundError(DEVICES_FILE)
+    
     # Load devices
-    with open(DEVICES_FILE, 'r') as f:
-        devices = json.load(f)
+    store = DeviceStore(DEVICES_FILE)
+    devices = store.all()
     
     print(f"Loaded {len(devices)} devices")
     
     # Find and fix TIS-HEALTH-CM devices
-    fixed_count = 0
+    changes = {}
     for device_id, device_data in devices.items():
         model = device_data.get('model_name', '')
         entity_type = device_data.get('entity_type', '')
         
         if 'HEALTH' in model.upper() and entity_type == 'binary_sensor':
             print(f"Fixing {device_id}: {model} - changing entity_type from 'binary_sensor' to 'sensor'")
-            device_data['entity_type'] = 'sensor'
-            fixed_count += 1
+            changes[device_id] = {'entity_type': 'sensor'}
     
+    # Save back (atomic, only changed records re-encoded)
+    fixed_count = store.update_many(changes)
     if fixed_count > 0:
-        # Save back
-        with open(DEVICES_FILE, 'w') as f:
-            json.dump(devices, f, indent=2, ensure_ascii=False)
         print(f"✅ Fixed {fixed_count} devices, saved to {DEVICES_FILE}")
     else:
         print("No devices needed fixing")
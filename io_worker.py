@@ -0,0 +1,98 @@
+"""Blocking I/O off the event loop.
+
+Cihaz deposu ve önbellek dosyaları (open/json/fsync, SQLite) tek bir arka plan
+iş parçacığında çalıştırılır; SD kartlı cihazlarda yavaş bir yazma SSE akışını
+ve kontrol komutlarını bekletmez. Tek iş parçacığı olduğu için dosya işlemleri
+sırayla uygulanır.
+"""
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+_LOGGER = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = 0.1      # Ölçüm aralığı (saniye)
+LOOP_LAG_WARN = 0.25         # Bu kadar gecikme loglanır
+LOOP_LAG_SAMPLES = 600       # Son ~60 s
+
+
+class IOWorker:
+    """Single-thread executor for file and database work."""
+
+    def __init__(self, name: str = 'tis-io'):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self.calls = 0
+        self.busy = 0.0
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {'calls': self.calls, 'busy_ms': round(self.busy * 1000, 1)}
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on the I/O thread and await its result."""
+        loop = asyncio.get_running_loop()
+        self.calls += 1
+        return await loop.run_in_executor(self._executor, functools.partial(self._timed, func, *args, **kwargs))
+
+    def _timed(self, func: Callable, *args, **kwargs) -> Any:
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.busy += time.perf_counter() - started
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed-interval sleep."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, warn: float = LOOP_LAG_WARN):
+        self.interval = interval
+        self.warn = warn
+        self.samples = deque(maxlen=LOOP_LAG_SAMPLES)
+        self.max_lag = 0.0
+        self._task = None
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        if not samples:
+            return {'samples': 0}
+        return {
+            'samples': len(samples),
+            'avg_ms': round(sum(samples) / len(samples) * 1000, 2),
+            'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2),
+            'recent_max_ms': round(samples[-1] * 1000, 2),
+            'max_ms': round(self.max_lag * 1000, 2),
+        }
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.samples.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > self.warn:
+                _LOGGER.warning(f"⚠️ Event loop blocked for {lag * 1000:.0f} ms")
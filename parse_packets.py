@@ -1,4 +1,5 @@
 import struct
+from tis_protocol import calculate_crc
 
 packets = [
     ('CRC00001', '20:25:08.377', '0C 01 28 CC B2 01 1E 01 FE 01 39 0E'),
@@ -66,7 +67,8 @@ for crc_id, timestamp, pkt_hex in packets:
                 val2 = payload[2]
                 print(f'    → Query: 0x{val1:04X}, Channel: {val2}')
     
-    print(f'  CRC: 0x{crc:04X}')
+    crc_ok = calculate_crc(data[:-2]) == crc
+    print(f'  CRC: 0x{crc:04X} ({"OK" if crc_ok else "HATALI"})')
     print()
 
 # Summary
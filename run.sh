@@ -5,10 +5,17 @@ CONFIG_PATH=/data/options.json
 
 # Read configuration from options.json
 LOG_LEVEL=$(jq --raw-output '.log_level // "info"' $CONFIG_PATH)
+INTERFACE=$(jq --raw-output '.interface // ""' $CONFIG_PATH)
+PASSIVE_DISCOVERY=$(jq --raw-output '.passive_discovery // false' $CONFIG_PATH)
+DEVICE_BACKEND=$(jq --raw-output '.device_backend // "json"' $CONFIG_PATH)
 
 echo "[INFO] Starting TIS Control Web UI..."
 echo "[INFO] Log Level: ${LOG_LEVEL}"
-echo "[INFO] Device discovery via TIS integration API"
+if [ -n "$INTERFACE" ]; then
+    echo "[INFO] SMARTCLOUD interface: ${INTERFACE}"
+fi
+echo "[INFO] Device discovery on the shared TIS bus"
+echo "[INFO] Device registry backend: ${DEVICE_BACKEND}"
 
 # Check for Supervisor token
 if [ -n "$SUPERVISOR_TOKEN" ]; then
@@ -17,8 +24,14 @@ else
     echo "[WARNING] No supervisor token - Auto-reload disabled"
 fi
 
+EXTRA_ARGS=""
+if [ "$PASSIVE_DISCOVERY" = "true" ]; then
+    echo "[INFO] Passive discovery enabled - no discovery broadcasts"
+    EXTRA_ARGS="--passive-discovery"
+fi
+
 # Change to app directory
 cd /app
 
 # Start web server (no gateway/port params needed)
-exec python3 web_ui.py --log-level "${LOG_LEVEL}"
+exec python3 web_ui.py --log-level "${LOG_LEVEL}" --interface "${INTERFACE}" --device-backend "${DEVICE_BACKEND}" ${EXTRA_ARGS}
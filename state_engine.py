@@ -0,0 +1,194 @@
+"""Live channel state cache fed by TIS bus traffic.
+
+Bus'taki 0x0032 (tek kanal geri bildirimi) ve 0x0034 (çok kanallı durum)
+paketlerini dinler ve her cihaz için kanal değerlerini bellekte tutar.
+/api/state okumaları bus'a hiç gitmeden buradan karşılanır.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+STATE_OP_CODES = (0x0032, 0x0034)
+MAX_CHANNELS = 64
+
+
+class ChannelStates:
+    """Compact channel states - one byte per channel (index 0 = channel 1).
+
+    is_on/brightness are derived on demand instead of being stored as a dict per
+    channel, so memory and JSON size scale with the channel count in bytes.
+    """
+
+    __slots__ = ('values',)
+
+    def __init__(self, values: bytes = b''):
+        self.values = bytearray(values)
+
+    @classmethod
+    def from_status(cls, state_bytes: bytes, channels: Optional[int] = None) -> Optional['ChannelStates']:
+        """0x0034 payload [count, ch1..chn] - None when shorter than expected.
+
+        channels=None uses the count reported by the device.
+        """
+        if not state_bytes:
+            return None
+        if channels is None:
+            channels = state_bytes[0]
+        if len(state_bytes) < channels + 1:
+            return None
+        return cls(state_bytes[1:channels + 1])
+
+    @classmethod
+    def from_hex(cls, text: str) -> 'ChannelStates':
+        return cls(bytes.fromhex(text or ''))
+
+    @classmethod
+    def from_expanded(cls, states: Dict[Any, Dict[str, Any]]) -> 'ChannelStates':
+        """Legacy {channel: {'raw_value': ...}} dict."""
+        result = cls()
+        for channel, state in states.items():
+            result.set(int(channel), state.get('raw_value', 0))
+        return result
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __bool__(self) -> bool:
+        return bool(self.values)
+
+    def set(self, channel: int, value: int):
+        if channel > len(self.values):
+            self.values.extend(bytes(channel - len(self.values)))
+        self.values[channel - 1] = value
+
+    def update(self, values: bytes):
+        """Overwrite channels 1..len(values), keep the rest."""
+        self.values[:len(values)] = values
+
+    def raw(self, channel: int) -> int:
+        return self.values[channel - 1] if 0 < channel <= len(self.values) else 0
+
+    def is_on(self, channel: int) -> bool:
+        return self.raw(channel) > 0
+
+    def brightness(self, channel: int) -> int:
+        """Yüzde parlaklık (raw / 255)"""
+        return int((self.raw(channel) / 255.0) * 100)
+
+    def hex(self) -> str:
+        """Storage form: two hex digits per channel."""
+        return self.values.hex()
+
+    def expanded(self) -> Dict[str, Dict[str, Any]]:
+        """Legacy per-channel dict (integration-facing tis_devices.json)."""
+        return {
+            str(channel): {
+                'is_on': self.is_on(channel),
+                'brightness': self.brightness(channel),
+                'raw_value': self.raw(channel),
+            }
+            for channel in range(1, len(self.values) + 1)
+        }
+
+
+class DeviceState:
+    """Live channel states of one device."""
+
+    __slots__ = ('states', 'updated_at')
+
+    def __init__(self):
+        self.states = ChannelStates()
+        self.updated_at = 0.0
+
+    @property
+    def values(self) -> bytearray:
+        return self.states.values
+
+    def to_dict(self, expanded: bool = False) -> Dict[str, Any]:
+        result = {
+            'channels': list(self.states.values),
+            'updated_at': self.updated_at,
+        }
+        if expanded:
+            result['states'] = self.states.expanded()
+        return result
+
+
+class StateEngine:
+    """Per-device channel arrays kept current from bus traffic."""
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.devices: Dict[Tuple[int, int], DeviceState] = {}
+        self.frames_applied = 0
+        self._task = None
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'devices': len(self.devices),
+            'frames_applied': self.frames_applied,
+        }
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+            _LOGGER.info("State engine started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def apply(self, parsed) -> bool:
+        """Update state from one 0x0032/0x0034 frame."""
+        data = parsed['additional_data']
+        op_code = parsed['op_code']
+        key = (parsed['src_subnet'], parsed['src_device'])
+
+        if op_code == 0x0032:
+            # [kanal, 0xF8, değer]
+            if len(data) < 3 or not 1 <= data[0] <= MAX_CHANNELS:
+                return False
+            state = self.devices.get(key)
+            if state is None:
+                state = self.devices[key] = DeviceState()
+            state.states.set(data[0], data[2])
+        elif op_code == 0x0034:
+            # [kanal sayısı, kanal 1..n]
+            if not data or len(data) < data[0] + 1 or data[0] > MAX_CHANNELS:
+                return False
+            state = self.devices.get(key)
+            if state is None:
+                state = self.devices[key] = DeviceState()
+            state.states.update(data[1:data[0] + 1])
+        else:
+            return False
+
+        state.updated_at = time.time()
+        self.frames_applied += 1
+        return True
+
+    def get(self, subnet: int, device: int) -> Optional[DeviceState]:
+        return self.devices.get((subnet, device))
+
+    def snapshot(self, expanded: bool = False) -> Dict[str, Dict[str, Any]]:
+        """All known device states keyed by unique_id."""
+        return {f"tis_{subnet}_{device}": state.to_dict(expanded)
+                for (subnet, device), state in self.devices.items()}
+
+    async def _run(self):
+        with self.bus.subscribe(op_codes=STATE_OP_CODES, maxsize=4096) as sub:
+            async for parsed, ip, _ in sub:
+                try:
+                    self.apply(parsed)
+                except Exception as e:
+                    _LOGGER.debug(f"State frame skipped: {e}")
@@ -0,0 +1,249 @@
+"""TIS UDP Bus Hub - process-wide single socket with subscriber fan-out.
+
+Port 6000'e bağlanan tek bir socket tüm süreç tarafından paylaşılır. Gelen her
+datagram bir kez çözülür, bekleyen sorgular (TISRequestCorrelator) tamamlanır ve
+filtreleri eşleşen tüm abonelere (discovery, sorgular, debug sniffer) dağıtılır.
+Böylece SO_REUSEPORT ile aynı portu paylaşan socket'ler arasında kernel'in
+paketleri bölüştürmesi ve yanıtların kaybolması önlenir.
+"""
+import asyncio
+import logging
+import socket
+from typing import Dict, Iterable, Optional, Tuple
+
+from const import UDP_PORT
+from tis_protocol import PARSE_STATS, TISFrame, TISRequestCorrelator, TISStreamDecoder, TISUDPClient
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 256
+
+# (parsed, ip, raw datagram) - parsed bir TISFrame, çözülemeyen paketlerde None'dır
+BusFrame = Tuple[Optional[TISFrame], str, bytes]
+
+
+def _is_target(ip: Optional[str]) -> bool:
+    """Unicast hedef mi? (None/''/0.0.0.0 = broadcast)"""
+    return ip not in (None, '', '0.0.0.0')
+
+
+class TISSubscription:
+    """Bus aboneliği - filtreli, sınırlı kuyruk
+
+    Kuyruk dolarsa yeni paketler atılır ve `dropped` sayacı artar; yavaş bir
+    abone diğer abonelerin veya alma döngüsünün önünü tıkamaz.
+    """
+
+    def __init__(self, bus: 'TISBus', op_codes: Optional[Iterable[int]] = None,
+                 sources: Optional[Iterable[Tuple[int, int]]] = None,
+                 maxsize: int = DEFAULT_QUEUE_SIZE, include_invalid: bool = False):
+        self.bus = bus
+        self.op_codes = frozenset(op_codes) if op_codes is not None else None
+        self.sources = frozenset(sources) if sources is not None else None
+        self.include_invalid = include_invalid
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def matches(self, parsed: Optional[TISFrame]) -> bool:
+        """Paket bu aboneliğin filtresine uyuyor mu?"""
+        if parsed is None:
+            return self.include_invalid and self.op_codes is None and self.sources is None
+        if self.op_codes is not None and parsed.op_code not in self.op_codes:
+            return False
+        if self.sources is not None and (parsed.src_subnet, parsed.src_device) not in self.sources:
+            return False
+        return True
+
+    def put(self, frame: BusFrame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def get(self, timeout: Optional[float] = None) -> BusFrame:
+        """Sıradaki paketi al - zaman aşımında (None, None, b'') döner"""
+        try:
+            if timeout is None:
+                return await self.queue.get()
+            return await asyncio.wait_for(self.queue.get(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            return None, None, b''
+
+    def close(self):
+        """Aboneliği bus'tan çıkar"""
+        if not self.closed:
+            self.closed = True
+            self.bus.unsubscribe(self)
+
+    def __enter__(self) -> 'TISSubscription':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> BusFrame:
+        if self.closed:
+            raise StopAsyncIteration
+        return await self.queue.get()
+
+
+class TISBus:
+    """Süreç genelinde tek UDP socket sahibi
+
+    Kullanım:
+        bus = await get_bus(gateway_ip, port)
+        with bus.subscribe(op_codes={0xF004}) as sub:
+            await bus.send(packet)
+            parsed, ip, data = await sub.get(timeout=1.0)
+        parsed = await bus.request(subnet, device, 0x0033)
+    """
+
+    _instances: Dict[int, 'TISBus'] = {}
+
+    def __init__(self, gateway_ip: Optional[str] = None, port: int = UDP_PORT):
+        self.gateway_ip = gateway_ip
+        self.port = port
+        self.client = TISUDPClient(gateway_ip, port)
+        self.correlator = TISRequestCorrelator(self.client, gateway_ip)
+        self.datagrams_received = 0
+        self.frames_received = 0
+        self.parse_errors = 0
+        self._decoders: Dict[str, TISStreamDecoder] = {}  # Kaynak IP başına yarım paket taşıyıcı
+        self._subscriptions = []
+        self._pump_task = None
+        self._start_lock = asyncio.Lock()
+        self._ignored_gateways = set()  # Uyarısı verilmiş farklı gateway'ler
+
+    @classmethod
+    def instance(cls, gateway_ip: Optional[str] = None, port: int = UDP_PORT) -> 'TISBus':
+        """Port başına tek bus örneği
+
+        Bus'ın hedefi ilk çağıranın gateway_ip'sidir. Farklı bir gateway'e gitmesi
+        gereken sorgular hedefi request(..., ip=...) ile paket başına vermelidir.
+        """
+        bus = cls._instances.get(port)
+        if bus is None:
+            bus = cls._instances[port] = cls(gateway_ip, port)
+        elif _is_target(gateway_ip) and gateway_ip != bus.gateway_ip and gateway_ip not in bus._ignored_gateways:
+            bus._ignored_gateways.add(gateway_ip)
+            _LOGGER.warning(f"TIS bus on port {port} already targets {bus.gateway_ip if _is_target(bus.gateway_ip) else 'broadcast'}; "
+                            f"gateway {gateway_ip} ignored (pass ip= per request instead)")
+        return bus
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Alma istatistikleri"""
+        return {
+            'datagrams_received': self.datagrams_received,
+            'frames_received': self.frames_received,
+            'parse_errors': self.parse_errors,
+            'crc_rejected': PARSE_STATS['crc_rejected'],
+            'truncated': PARSE_STATS['truncated'],
+            'resyncs': sum(decoder.resyncs for decoder in self._decoders.values()),
+            'subscribers': len(self._subscriptions),
+            'subscriber_dropped': sum(sub.dropped for sub in self._subscriptions),
+            'pending_requests': self.correlator.pending_count,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._pump_task is not None and not self._pump_task.done()
+
+    async def start(self) -> bool:
+        """Socket'i aç ve alma döngüsünü başlat (tekrar çağrılabilir)"""
+        async with self._start_lock:
+            if self.is_running:
+                return True
+            if not await self.client.async_connect(bind=True, use_asyncio=True):
+                return False
+            try:
+                self.client.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            except Exception:
+                pass
+            self._pump_task = asyncio.ensure_future(self._pump())
+            _LOGGER.info(f"TIS bus started on UDP port {self.port}")
+            return True
+
+    async def stop(self):
+        """Alma döngüsünü durdur ve socket'i kapat"""
+        await self.correlator.stop()
+        if self._pump_task:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+        self.client.close()
+        TISBus._instances.pop(self.port, None)
+
+    def subscribe(self, op_codes: Optional[Iterable[int]] = None,
+                  sources: Optional[Iterable[Tuple[int, int]]] = None,
+                  maxsize: int = DEFAULT_QUEUE_SIZE, include_invalid: bool = False) -> TISSubscription:
+        """Yeni abonelik oluştur
+
+        Args:
+            op_codes: Sadece bu OpCode'lar (None = hepsi)
+            sources: Sadece bu (subnet, device) kaynakları (None = hepsi)
+            maxsize: Kuyruk sınırı
+            include_invalid: Çözülemeyen datagramları da al (parsed=None)
+        """
+        subscription = TISSubscription(self, op_codes, sources, maxsize, include_invalid)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: TISSubscription):
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+
+    async def send(self, packet: bytes, ip: Optional[str] = None):
+        """Paket gönder - ip=None ise broadcast"""
+        await self.client.async_send(packet, ip)
+
+    async def request(self, *args, **kwargs) -> Optional[TISFrame]:
+        """Sorgu gönder ve yanıtı bekle (bkz. TISRequestCorrelator.request)"""
+        return await self.correlator.request(*args, **kwargs)
+
+    def dispatch(self, data: bytes, ip: str):
+        """Datagramdaki tüm paketleri çöz (CRC doğrulamalı), sorgularla eşleştir ve abonelere dağıt"""
+        self.datagrams_received += 1
+        decoder = self._decoders.get(ip)
+        if decoder is None:
+            decoder = self._decoders[ip] = TISStreamDecoder()
+        frames = decoder.feed(data)
+
+        if not frames:
+            if not decoder.pending:
+                self.parse_errors += 1
+            # Çözülemeyen datagram sadece include_invalid abonelere gider
+            for subscription in self._subscriptions:
+                if subscription.matches(None):
+                    subscription.put((None, ip, data))
+            return
+
+        for parsed in frames:
+            self.frames_received += 1
+            self.correlator.feed(parsed, ip)
+            frame = (parsed, ip, data)
+            for subscription in self._subscriptions:
+                if subscription.matches(parsed):
+                    subscription.put(frame)
+
+    async def _pump(self):
+        async for data, ip in self.client:
+            try:
+                self.dispatch(data, ip)
+            except Exception as e:
+                _LOGGER.error(f"Bus dispatch error: {e}")
+
+
+async def get_bus(gateway_ip: Optional[str] = None, port: int = UDP_PORT) -> TISBus:
+    """Süreç genelindeki bus'ı döndür, gerekirse başlat"""
+    bus = TISBus.instance(gateway_ip, port)
+    if not await bus.start():
+        raise OSError(f"UDP port {port} could not be opened")
+    return bus
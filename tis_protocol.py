@@ -3,7 +3,9 @@ import socket
 import struct
 import logging
 import asyncio
-from typing import Optional, Tuple, Dict, Any
+import binascii
+import functools
+from typing import Optional, Tuple, Dict, Any, Iterable, List
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -43,10 +45,35 @@ CRC_TABLE = [
     0x6e17, 0x7e36, 0x4e55, 0x5e74, 0x2e93, 0x3eb2, 0x0ed1, 0x1ef0
 ]
 
-def calculate_crc(data: bytes) -> int:
+# Sorgu OpCode -> yanıt OpCode (TIS'te yanıt genelde sorgu + 1)
+RESPONSE_OPCODES = {
+    0x0031: 0x0032,
+    0x0033: 0x0034,
+    0x000E: 0x000F,
+    0xEFFD: 0xEFFE,
+    0xF003: 0xF004,
+    0xF00A: 0xF00B,
+    0xF00E: 0xF00F,
+    0xF012: 0xF013,
+}
+
+# Yanıtı kanal numarası ile ayırt edilen OpCode'lar (additional_data[0] = kanal)
+CHANNEL_KEYED_OPCODES = {0x0032, 0xF00F}
+
+SMARTCLOUD_MARKER = b'SMARTCLOUD'
+
+
+def smartcloud_offset(data: bytes) -> int:
+    """SMARTCLOUD zarfından sonraki TIS paketinin indeksi (zarf yoksa 0) - kopyalamaz"""
+    if data.startswith(SMARTCLOUD_MARKER, 4):
+        return 4 + len(SMARTCLOUD_MARKER)
+    return 0
+
+
+def calculate_crc_table(data: bytes) -> int:
     """
     TIS CRC hesaplama - C kodu ile %100 uyumlu
-    TIS dokümantasyonundaki Pack_crc fonksiyonu
+    TIS dokümantasyonundaki Pack_crc fonksiyonu (byte başına tablo, saf Python)
     """
     crc = 0
     for byte in data:
@@ -56,6 +83,44 @@ def calculate_crc(data: bytes) -> int:
     return crc
 
 
+def calculate_crc(data: bytes) -> int:
+    """
+    TIS CRC hesaplama (CRC-16/XMODEM: poly 0x1021, init 0)
+    
+    Pack_crc ile aynı sonucu verir; binascii.crc_hqx C'de çalıştığı için her
+    paketi doğrulamak hot path'te ucuzdur.
+    """
+    return binascii.crc_hqx(data, 0)
+
+
+# Doğrulama sayaçları (TISFrame.parse(verify=True))
+PARSE_STATS = {
+    'crc_rejected': 0,  # CRC uyuşmayan paketler
+    'truncated': 0,     # Bildirilen uzunluktan kısa paketler
+}
+
+
+def verify_crc_batch(packets: Iterable[bytes]) -> List[bool]:
+    """Yakalanmış paketleri toplu doğrula (SMARTCLOUD zarflı veya AA AA ile başlayan)
+    
+    Returns:
+        Her paket için CRC geçerli mi
+    """
+    crc_hqx = binascii.crc_hqx
+    results = []
+    for data in packets:
+        start = data.find(b'\xAA\xAA', smartcloud_offset(data))
+        if start < 0 or len(data) - start < 13:
+            results.append(False)
+            continue
+        end = start + data[start + 2]
+        if end + 2 > len(data):
+            results.append(False)
+            continue
+        results.append(crc_hqx(data[start + 2:end], 0) == ((data[end] << 8) | data[end + 1]))
+    return results
+
+
 class TISPacket:
     """TIS UDP Packet Builder"""
     
@@ -169,17 +234,359 @@ class TISPacket:
             return None
 
 
+class TISPacketTemplate:
+    """Önceden derlenmiş paket şablonu - (kaynak kimliği, hedef, OpCode, zarf) başına
+    
+    Sabit kısım (SMARTCLOUD zarfı + AA AA + SN3-SN10) ve bu kısmın CRC ara durumu
+    payload uzunluğu başına bir kez hesaplanır; build() sadece payload'ı ve
+    CRC'nin kalanını ekler (crc_hqx kaldığı yerden devam edebilir).
+    """
+    
+    __slots__ = ('envelope', '_body', '_heads')
+    
+    def __init__(self, op_code: int, tgt_subnet: int, tgt_device: int,
+                 src_subnet: int = 1, src_device: int = 254, src_type: int = 0xFFFE,
+                 envelope: bytes = b''):
+        self.envelope = envelope
+        self._body = bytes([
+            src_subnet, src_device,
+            (src_type >> 8) & 0xFF, src_type & 0xFF,
+            (op_code >> 8) & 0xFF, op_code & 0xFF,
+            tgt_subnet, tgt_device,
+        ])
+        self._heads: Dict[int, Tuple[bytes, int]] = {}
+    
+    def _head(self, data_len: int) -> Tuple[bytes, int]:
+        head = self._heads.get(data_len)
+        if head is None:
+            length_and_body = bytes([11 + data_len]) + self._body
+            head = (self.envelope + b'\xAA\xAA' + length_and_body, binascii.crc_hqx(length_and_body, 0))
+            self._heads[data_len] = head
+        return head
+    
+    def build(self, additional_data: bytes = b'') -> bytes:
+        """Tam paket (zarf dahil) - TISPacket.build ile aynı byte'lar"""
+        prefix, crc_state = self._head(len(additional_data))
+        crc = binascii.crc_hqx(additional_data, crc_state)
+        return prefix + additional_data + bytes([(crc >> 8) & 0xFF, crc & 0xFF])
+
+
+@functools.lru_cache(maxsize=512)
+def get_packet_template(op_code: int, tgt_subnet: int, tgt_device: int, envelope: bytes = b'',
+                        src_subnet: int = 1, src_device: int = 254, src_type: int = 0xFFFE) -> TISPacketTemplate:
+    """Şablon önbelleği - aynı hedefe giden paketler aynı şablonu paylaşır"""
+    return TISPacketTemplate(op_code, tgt_subnet, tgt_device, src_subnet, src_device, src_type, envelope)
+
+
+@functools.lru_cache(maxsize=2048)
+def build_control_frame(subnet: int, device_id: int, channel: int, state: int, envelope: bytes = b'') -> bytes:
+    """0x0031 kontrol paketi - on/off/parlaklık paketleri tamamen önbellekten gelir
+    
+    Sahne aktivasyonu gibi aynı komutları tekrar tekrar gönderen akışlarda
+    paket bir kez üretilir, sonrası sadece önbellek okumasıdır.
+    """
+    template = get_packet_template(0x0031, subnet, device_id, envelope)
+    return template.build(bytes([channel, state]))
+
+
+# AA AA + Length + SN3-SN10 başlığı: start_code, length, src_subnet, src_device,
+# src_type, op_code, tgt_subnet, tgt_device
+_FRAME_HEADER = struct.Struct('>HBBBHHBB')
+
+
+class TISFrame:
+    """Çözülmüş TIS paketi - dict yerine kompakt __slots__ nesnesi
+    
+    TISPacket.parse her datagram için 10 anahtarlı bir dict ve additional_data
+    kopyası üretir. TISFrame başlığı tek bir struct.unpack_from çağrısıyla slot'lara
+    açar ve datagram'ın kendisini tutar; payload sadece istendiğinde, kopyasız bir
+    memoryview olarak oluşturulur. Eski kod için dict tarzı erişim
+    (`frame['op_code']`, `frame.get('additional_data')`) desteklenir.
+    """
+    
+    __slots__ = ('_buf', '_start', 'start_code', 'length', 'src_subnet', 'src_device',
+                 'src_type', 'op_code', 'tgt_subnet', 'tgt_device')
+    
+    FIELDS = ('start_code', 'length', 'src_subnet', 'src_device', 'src_type',
+              'op_code', 'tgt_subnet', 'tgt_device', 'additional_data', 'crc')
+    
+    @classmethod
+    def parse(cls, data, offset: int = 0, verify: bool = False) -> Optional['TISFrame']:
+        """Datagram'ı çöz - geçersizse None
+        
+        Args:
+            data: bytes/bytearray datagram (kopyalanmaz)
+            offset: AA AA aramasının başlayacağı indeks (bkz. smartcloud_offset)
+            verify: Bildirilen uzunluk ve CRC'yi doğrula; bozuk/kesik paketler
+                reddedilir ve PARSE_STATS sayaçları artar
+        """
+        start = data.find(b'\xAA\xAA', offset)
+        if start < 0:
+            start = offset
+        if len(data) - start < 13:
+            if verify:
+                PARSE_STATS['truncated'] += 1
+            return None
+        
+        frame = cls.__new__(cls)
+        frame._buf = data
+        frame._start = start
+        (frame.start_code, frame.length, frame.src_subnet, frame.src_device,
+         frame.src_type, frame.op_code, frame.tgt_subnet, frame.tgt_device) = _FRAME_HEADER.unpack_from(data, start)
+        
+        if verify:
+            end = start + frame.length
+            if end + 2 > len(data):
+                PARSE_STATS['truncated'] += 1
+                return None
+            if binascii.crc_hqx(data[start + 2:end], 0) != ((data[end] << 8) | data[end + 1]):
+                PARSE_STATS['crc_rejected'] += 1
+                return None
+        return frame
+    
+    def crc_ok(self) -> bool:
+        """Bildirilen uzunluktaki CRC, Length + Data Package ile uyuşuyor mu?"""
+        buf, start = self._buf, self._start
+        end = start + self.length
+        if end + 2 > len(buf):
+            return False
+        return binascii.crc_hqx(buf[start + 2:end], 0) == ((buf[end] << 8) | buf[end + 1])
+    
+    def _payload_bounds(self) -> Tuple[int, int]:
+        start = self._start + 11
+        end = self._start + self.length
+        if self.length > 11 and end <= len(self._buf):
+            return start, end
+        return start, start
+    
+    @property
+    def crc(self) -> int:
+        buf = self._buf
+        end = self._start + self.length
+        if end + 2 <= len(buf):
+            return (buf[end] << 8) | buf[end + 1]
+        return (buf[-2] << 8) | buf[-1]
+    
+    @property
+    def payload_length(self) -> int:
+        start, end = self._payload_bounds()
+        return end - start
+    
+    @property
+    def payload(self) -> memoryview:
+        """additional_data (SN11-N) - kopyasız görünüm"""
+        start, end = self._payload_bounds()
+        return memoryview(self._buf)[start:end]
+    
+    def payload_at(self, index: int, default: Optional[int] = None) -> Optional[int]:
+        """Payload'ın tek bir byte'ı (görünüm oluşturmadan) - yoksa default"""
+        start, end = self._payload_bounds()
+        if start + index < end:
+            return self._buf[start + index]
+        return default
+    
+    @property
+    def additional_data(self) -> bytes:
+        """additional_data kopyası (bytes) - eski dict API uyumluluğu için"""
+        start, end = self._payload_bounds()
+        return bytes(self._buf[start:end])
+    
+    @property
+    def raw(self) -> memoryview:
+        """AA AA'dan başlayan TIS paketi"""
+        return memoryview(self._buf)[self._start:]
+    
+    @property
+    def packet(self) -> memoryview:
+        """Sadece bu paket (AA AA .. CRC) - datagram'daki sonraki paketler hariç"""
+        return memoryview(self._buf)[self._start:self._start + self.length + 2]
+    
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __contains__(self, key) -> bool:
+        return key in self.FIELDS
+    
+    def get(self, key: str, default=None):
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key)
+    
+    def keys(self):
+        return self.FIELDS
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """TISPacket.parse ile aynı dict"""
+        return {key: getattr(self, key) for key in self.FIELDS}
+    
+    def __repr__(self) -> str:
+        return (f"TISFrame({self.src_subnet}.{self.src_device} -> {self.tgt_subnet}.{self.tgt_device}, "
+                f"op=0x{self.op_code:04X}, payload={self.payload.hex()})")
+
+
+class TISStreamDecoder:
+    """Artımlı çözücü - bir datagram'daki TÜM paketleri uzunluk byte'ına göre çıkarır
+    
+    Gateway'ler ve SMARTCLOUD röleleri tek datagram'da birden fazla paket
+    gönderebilir. Decoder buffer'ı AA AA + Length ile yürür, her tam paketi
+    (CRC doğrulamalı) döndürür ve sondaki yarım paketi bir sonraki feed()
+    çağrısına taşır. CRC tutmayan bir AA AA yanlış senkron sayılır ve arama bir
+    byte ileriden devam eder.
+    """
+    
+    MIN_LENGTH = 11      # Length(1) + SN3-SN10(8) + CRC(2)
+    MAX_PENDING = 1024   # Taşınan yarım paket sınırı
+    
+    def __init__(self, verify: bool = True):
+        self.verify = verify
+        self.frames_decoded = 0
+        self.resyncs = 0
+        self._pending = b''
+    
+    @property
+    def pending(self) -> int:
+        """Bir sonraki okumaya taşınan byte sayısı"""
+        return len(self._pending)
+    
+    def reset(self):
+        self._pending = b''
+    
+    def _has_frame_after(self, buf: bytes, pos: int) -> bool:
+        """pos'tan sonra tam ve geçerli bir paket var mı?"""
+        while True:
+            start = buf.find(b'\xAA\xAA', pos)
+            if start < 0 or len(buf) - start < 13:
+                return False
+            end = start + 2 + buf[start + 2]
+            if end <= len(buf) and buf[start + 2] >= self.MIN_LENGTH:
+                if binascii.crc_hqx(buf[start + 2:end - 2], 0) == ((buf[end - 2] << 8) | buf[end - 1]):
+                    return True
+            pos = start + 1
+    
+    def feed(self, data: bytes) -> List[TISFrame]:
+        """Yeni veriyi ekle, tamamlanan paketleri döndür"""
+        buf = self._pending + data if self._pending else data
+        self._pending = b''
+        frames = []
+        pos = 0
+        buf_len = len(buf)
+        
+        while True:
+            start = buf.find(b'\xAA\xAA', pos)
+            if start < 0:
+                # Yarım kalmış başlangıç kodu (tek 0xAA) bir sonraki okumaya
+                if buf_len and buf[-1] == 0xAA:
+                    self._pending = buf[-1:]
+                break
+            if buf_len - start < 3:
+                self._pending = buf[start:]
+                break
+            
+            length = buf[start + 2]
+            end = start + 2 + length
+            if length < self.MIN_LENGTH:
+                self.resyncs += 1
+                pos = start + 1
+                continue
+            if end > buf_len:
+                # Eski yarım paket, arkasındaki tam paketleri bekletmesin
+                if self._has_frame_after(buf, start + 2):
+                    self.resyncs += 1
+                    pos = start + 1
+                    continue
+                self._pending = buf[start:]
+                break
+            
+            frame = TISFrame.parse(buf, start, verify=self.verify)
+            if frame is None:
+                self.resyncs += 1
+                pos = start + 1
+                continue
+            
+            frames.append(frame)
+            pos = end
+        
+        if len(self._pending) > self.MAX_PENDING:
+            _LOGGER.debug(f"Stream decoder: {len(self._pending)} byte yarım paket atıldı")
+            self._pending = b''
+        
+        self.frames_decoded += len(frames)
+        return frames
+
+
+def decode_datagram(data: bytes, verify: bool = True) -> List[TISFrame]:
+    """Tek bir datagram'daki tüm paketler (durumsuz)"""
+    return TISStreamDecoder(verify).feed(data)
+
+
+class TISDatagramProtocol(asyncio.DatagramProtocol):
+    """asyncio UDP protocol - gelen datagramları sınırlı bir kuyruğa alır"""
+    
+    def __init__(self, queue_size: int = 1024):
+        self.transport = None
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+    
+    def connection_made(self, transport):
+        self.transport = transport
+    
+    def datagram_received(self, data: bytes, addr):
+        try:
+            self.queue.put_nowait((data, addr[0]))
+        except asyncio.QueueFull:
+            # Okuyucu yetişemiyor - en yeni paketi at, sayacı artır
+            self.dropped += 1
+    
+    def error_received(self, exc):
+        _LOGGER.error(f"UDP transport hatası: {exc}")
+    
+    def connection_lost(self, exc):
+        self._can_write.set()
+        # Bekleyen okuyucuları uyandır (None = transport kapandı)
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+    
+    def pause_writing(self):
+        self._can_write.clear()
+    
+    def resume_writing(self):
+        self._can_write.set()
+    
+    async def drain(self):
+        """Kernel gönderme tamponu boşalana kadar bekle"""
+        await self._can_write.wait()
+
+
 class TISUDPClient:
-    """TIS UDP İletişim Client"""
+    """TIS UDP İletişim Client
+    
+    İki modda çalışır:
+    - Blocking socket (varsayılan): send_to/send_broadcast/receive doğrudan socket'i kullanır
+    - asyncio transport (use_asyncio=True): create_datagram_endpoint ile event loop
+      üzerinde çalışır, thread-pool'a ihtiyaç duymaz. async_send/async_receive ve
+      `async for data, ip in client` kullanılabilir; eski API bu modda da çalışır.
+    """
     
     def __init__(self, gateway_ip=None, port=6000):
         self.gateway_ip = gateway_ip or "192.168.1.200"
         self.port = port
         self.sock = None
+        self.transport = None
+        self.protocol = None
         self.is_connected = False
         
-    async def async_connect(self, bind: bool = True) -> bool:
-        """UDP socket aç - bind=True: port'a bağlan (yanıt almak için), bind=False: sadece gönder"""
+    async def async_connect(self, bind: bool = True, use_asyncio: bool = False) -> bool:
+        """UDP socket aç - bind=True: port'a bağlan (yanıt almak için), bind=False: sadece gönder
+        
+        use_asyncio=True ise socket bir asyncio DatagramProtocol transport'una bağlanır.
+        """
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -202,6 +609,14 @@ class TISUDPClient:
             else:
                 _LOGGER.info(f"TIS UDP client başlatıldı (send only)")
             
+            if use_asyncio:
+                self.sock.setblocking(False)
+                loop = asyncio.get_running_loop()
+                self.transport, self.protocol = await loop.create_datagram_endpoint(
+                    TISDatagramProtocol, sock=self.sock
+                )
+                _LOGGER.debug("asyncio datagram transport aktif")
+            
             self.is_connected = True
             return True
         except Exception as e:
@@ -211,7 +626,10 @@ class TISUDPClient:
     def send_broadcast(self, packet: bytes):
         """UDP broadcast gönder"""
         try:
-            if self.sock:
+            if self.transport:
+                self.transport.sendto(packet, ('<broadcast>', self.port))
+                _LOGGER.debug(f"UDP broadcast gönderildi: {packet.hex()}")
+            elif self.sock:
                 self.sock.sendto(packet, ('<broadcast>', self.port))
                 _LOGGER.debug(f"UDP broadcast gönderildi: {packet.hex()}")
         except Exception as e:
@@ -220,14 +638,76 @@ class TISUDPClient:
     def send_to(self, packet: bytes, ip: str):
         """Belirli IP'ye gönder"""
         try:
-            if self.sock:
+            if self.transport:
+                self.transport.sendto(packet, (ip, self.port))
+                _LOGGER.debug(f"UDP paketi gönderildi {ip}: {packet.hex()}")
+            elif self.sock:
                 self.sock.sendto(packet, (ip, self.port))
                 _LOGGER.debug(f"UDP paketi gönderildi {ip}: {packet.hex()}")
         except Exception as e:
             _LOGGER.error(f"UDP gönderme hatası: {e}")
     
+    async def async_send(self, packet: bytes, ip: Optional[str] = None):
+        """Paketi gönder - ip=None ise broadcast
+        
+        asyncio modunda kernel tamponu doluysa (pause_writing) boşalana kadar bekler,
+        blocking modda gönderimi executor'a devreder.
+        """
+        if self.transport:
+            await self.protocol.drain()
+            if ip is None:
+                self.send_broadcast(packet)
+            else:
+                self.send_to(packet, ip)
+            return
+        
+        loop = asyncio.get_running_loop()
+        if ip is None:
+            await loop.run_in_executor(None, self.send_broadcast, packet)
+        else:
+            await loop.run_in_executor(None, self.send_to, packet, ip)
+    
+    async def async_receive(self, timeout: Optional[float] = 1.0) -> Tuple[Optional[bytes], Optional[str]]:
+        """UDP paketi al (asyncio modu) - zaman aşımında (None, None) döner"""
+        if not self.protocol:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.receive, timeout or 1.0)
+        
+        try:
+            item = await asyncio.wait_for(self.protocol.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None, None
+        if item is None:
+            return None, None
+        return item
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self) -> Tuple[bytes, str]:
+        """Alınan datagramları (data, ip) olarak sırayla döndür"""
+        if not self.protocol:
+            raise StopAsyncIteration
+        item = await self.protocol.queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+    
     def receive(self, timeout=1.0) -> Tuple[Optional[bytes], Optional[str]]:
-        """UDP paketi al"""
+        """UDP paketi al
+        
+        asyncio modunda event loop'u bloklamamak için beklemez; kuyrukta hazır
+        paket yoksa (None, None) döner. Beklemek için async_receive kullanın.
+        """
+        if self.protocol:
+            try:
+                item = self.protocol.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return None, None
+            if item is None:
+                return None, None
+            return item
+        
         try:
             if self.sock:
                 self.sock.settimeout(timeout)
@@ -241,7 +721,12 @@ class TISUDPClient:
     
     def close(self):
         """Socket kapat"""
-        if self.sock:
+        if self.transport:
+            self.transport.close()  # socket'i de kapatır
+            self.transport = None
+            self.sock = None
+            self.is_connected = False
+        elif self.sock:
             self.sock.close()
             self.is_connected = False
     
@@ -255,29 +740,12 @@ class TISUDPClient:
             state: 0 = OFF, 1 = ON
         """
         try:
-            # Create control packet
-            packet = TISPacket()
-            packet.src_subnet = 1
-            packet.src_device = 254
-            packet.src_type = 0xFFFE
-            packet.tgt_subnet = subnet
-            packet.tgt_device = device_id
-            packet.op_code = 0x0031  # Control command
-            
-            # Build packet with channel and state
-            packet.additional_data = bytes([channel, state])
-            tis_data = packet.build()
+            # SMARTCLOUD header + control packet (0x0031, [channel, state]) from the frame cache
+            from discovery import get_smartcloud_envelope
+            full_packet = build_control_frame(subnet, device_id, channel, state, get_smartcloud_envelope())
             
-            # Add SMARTCLOUD header
-            from discovery import get_local_ip
-            local_ip = get_local_ip()
-            ip_bytes = bytes([int(x) for x in local_ip.split('.')])
-            smartcloud_header = b'SMARTCLOUD'
-            full_packet = ip_bytes + smartcloud_header + tis_data
-            
-            # Send via UDP
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, self.send_broadcast, full_packet)
+            # Send via UDP (asyncio modunda thread-pool'a gitmeden)
+            await self.async_send(full_packet)
             
             _LOGGER.info(f"Control command sent: Subnet {subnet}, Device {device_id}, Channel {channel}, State {state}")
         except Exception as e:
@@ -285,5 +753,155 @@ class TISUDPClient:
             raise
 
 
+class TISRequestCorrelator:
+    """Sorgu/yanıt eşleştirici - tek socket üzerinde eşzamanlı sorgular
+    
+    Her sorgu için (hedef subnet, cihaz, beklenen yanıt OpCode, [kanal]) anahtarıyla
+    bir future kaydedilir. Tek bir alma döngüsü (pump) gelen paketleri çözer ve
+    eşleşen future'ları tamamlar; böylece birçok cihaza yapılan sorgular aynı
+    socket'i paylaşır ve birbirlerinin yanıtlarını çöpe atmaz.
+    """
+    
+    def __init__(self, client: TISUDPClient, target_ip: Optional[str] = None):
+        self.client = client
+        self.target_ip = target_ip
+        self.on_unmatched = None  # callback(parsed, ip) - eşleşmeyen paketler için
+        self._pending: Dict[tuple, list] = {}
+        self._pump_task = None
+    
+    @staticmethod
+    def response_key(subnet: int, device: int, op_code: int, channel: Optional[int] = None) -> tuple:
+        """Bekleyen tablo anahtarı"""
+        if op_code not in CHANNEL_KEYED_OPCODES:
+            channel = None
+        return (subnet, device, op_code, channel)
+    
+    @property
+    def pending_count(self) -> int:
+        return sum(len(futures) for futures in self._pending.values())
+    
+    def expect(self, subnet: int, device: int, response_op: int, channel: Optional[int] = None) -> asyncio.Future:
+        """Beklenen yanıt için future kaydet"""
+        key = self.response_key(subnet, device, response_op, channel)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, []).append(future)
+        return future
+    
+    def _discard(self, key: tuple, future: asyncio.Future):
+        futures = self._pending.get(key)
+        if futures and future in futures:
+            futures.remove(future)
+            if not futures:
+                del self._pending[key]
+    
+    def feed(self, parsed: Dict[str, Any], ip: Optional[str] = None) -> bool:
+        """Çözülmüş paketi bekleyen sorgularla eşleştir - eşleşirse True"""
+        channel = None
+        if isinstance(parsed, TISFrame):
+            op_code = parsed.op_code
+            if op_code in CHANNEL_KEYED_OPCODES:
+                channel = parsed.payload_at(0)
+            src_subnet, src_device = parsed.src_subnet, parsed.src_device
+        else:
+            op_code = parsed['op_code']
+            if op_code in CHANNEL_KEYED_OPCODES and parsed['additional_data']:
+                channel = parsed['additional_data'][0]
+            src_subnet, src_device = parsed['src_subnet'], parsed['src_device']
+        
+        key = self.response_key(src_subnet, src_device, op_code, channel)
+        
+        futures = self._pending.pop(key, None)
+        if not futures:
+            if self.on_unmatched:
+                self.on_unmatched(parsed, ip)
+            return False
+        
+        for future in futures:
+            if not future.done():
+                future.set_result(parsed)
+        return True
+    
+    def _envelope(self) -> bytes:
+        from discovery import get_smartcloud_envelope
+        return get_smartcloud_envelope()
+    
+    async def request(self, subnet: int, device: int, op_code: int, additional_data: bytes = b'',
+                      timeout: float = 3.0, channel: Optional[int] = None,
+                      response_op: Optional[int] = None, ip: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Sorgu gönder ve eşleşen yanıtı bekle - zaman aşımında None döner
+        
+        Args:
+            subnet: Hedef subnet
+            device: Hedef cihaz
+            op_code: Sorgu OpCode'u
+            additional_data: Sorgu verisi
+            timeout: Yanıt bekleme süresi (saniye)
+            channel: Kanal anahtarlı yanıtlar için kanal (varsayılan: additional_data[0])
+            response_op: Beklenen yanıt OpCode'u (varsayılan: RESPONSE_OPCODES / op_code + 1)
+            ip: Unicast hedef IP (varsayılan: target_ip, yoksa broadcast)
+        """
+        if response_op is None:
+            response_op = RESPONSE_OPCODES.get(op_code, (op_code + 1) & 0xFFFF)
+        if channel is None and additional_data:
+            channel = additional_data[0]
+        
+        template = get_packet_template(op_code, subnet, device, self._envelope())
+        full_packet = template.build(bytes(additional_data))
+        
+        # Future gönderimden ÖNCE kaydedilir - hızlı yanıtlar kaçmasın
+        key = self.response_key(subnet, device, response_op, channel)
+        future = self.expect(subnet, device, response_op, channel)
+        try:
+            target = ip or self.target_ip
+            await self.client.async_send(full_packet, None if target in (None, '', '0.0.0.0') else target)
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._discard(key, future)
+    
+    def start(self):
+        """Alma döngüsünü başlat (client asyncio modunda bağlı olmalı)"""
+        if self._pump_task is None:
+            self._pump_task = asyncio.ensure_future(self._pump())
+    
+    async def stop(self):
+        """Alma döngüsünü durdur, bekleyen sorguları iptal et"""
+        if self._pump_task:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+        for futures in self._pending.values():
+            for future in futures:
+                future.cancel()
+        self._pending.clear()
+    
+    async def _pump(self):
+        async for data, ip in self.client:
+            try:
+                for parsed in decode_datagram(data):
+                    self.feed(parsed, ip)
+            except Exception as e:
+                _LOGGER.error(f"Yanıt eşleştirme hatası: {e}")
+    
+    @classmethod
+    async def open(cls, gateway_ip: Optional[str] = None, port: int = 6000) -> 'TISRequestCorrelator':
+        """Bağlı bir client ile yeni eşleştirici oluştur ve başlat"""
+        client = TISUDPClient(gateway_ip, port)
+        if not await client.async_connect(bind=True, use_asyncio=True):
+            raise OSError(f"UDP port {port} açılamadı")
+        correlator = cls(client, gateway_ip)
+        correlator.start()
+        return correlator
+    
+    async def close(self):
+        """Döngüyü durdur ve client'ı kapat"""
+        await self.stop()
+        self.client.close()
+
+
 # Alias for compatibility
 TISProtocol = TISUDPClient
@@ -4,49 +4,133 @@ import asyncio
 import argparse
 import os
 import json
-import socket
 import time
-from aiohttp import web
-from discovery import discover_tis_devices, get_local_ip, query_all_channel_names, query_device_initial_states
-from tis_protocol import TISProtocol, TISPacket, TISUDPClient
+from collections import deque
+from aiohttp import web, WSMsgType
+from discovery import LAST_DISCOVERY_STATS, PassiveDiscovery, get_local_ip, iter_discovery, rescan_tis_devices, snapshot_device_states, query_all_channel_names, query_device_initial_states, set_local_interface
+from tis_protocol import TISProtocol
+from tis_bus import get_bus
+from cache import ChannelNameCache, DiscoveryCache
+from state_engine import ChannelStates, StateEngine
+from device_store import DEVICE_BACKENDS, open_device_store
+from io_worker import IOWorker, LoopLagMonitor
+from file_watch import FileWatcher
 
 _LOGGER = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+BULK_QUERY_CONCURRENCY = 4  # Devices whose names/states are queried at the same time
+DEBUG_HISTORY = 200          # Recent debug messages kept for /api/debug/messages
+DEBUG_CLIENT_QUEUE = 1024    # Per WebSocket client; overflow is dropped and counted
+DEBUG_BATCH = 64             # Messages sent per WebSocket frame at most
+
+def _parse_device_type(value):
+    """device_type from a JSON body: 424, "424" or "0x01A8" (None when missing)."""
+    if isinstance(value, str):
+        value = int(value, 0)
+    return int(value) if value else None
+
+
+class DebugClient:
+    """Bounded queue of add-on debug events for one WebSocket client."""
+
+    def __init__(self, maxsize: int = DEBUG_CLIENT_QUEUE):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.sub = None  # Bus subscription of the same client
+
+    @property
+    def total_dropped(self) -> int:
+        return self.dropped + (self.sub.dropped if self.sub else 0)
+
+    def put(self, message: dict):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+
 class TISWebUI:
     """Web UI for TIS Control."""
 
-    def __init__(self, gateway_ip, udp_port):
+    def __init__(self, gateway_ip, udp_port, passive_discovery=False, device_backend='json'):
         """Initialize."""
         self.gateway_ip = gateway_ip
         self.udp_port = udp_port
+        self.passive_discovery = passive_discovery
         self.app = web.Application()
         self.app.router.add_get('/', self.handle_index)
         self.app.router.add_get('/api/info', self.handle_info)
         self.app.router.add_get('/api/devices', self.handle_devices)
         self.app.router.add_get('/api/devices/stream', self.handle_devices_stream)
+        self.app.router.add_get('/api/devices/sweep', self.handle_devices_sweep)
+        self.app.router.add_get('/api/snapshot', self.handle_snapshot)
+        self.app.router.add_get('/api/state', self.handle_state)
+        self.app.router.add_get('/api/registry', self.handle_registry)
         self.app.router.add_post('/api/control', self.handle_control)
         self.app.router.add_post('/api/query_device', self.handle_query_device)
         self.app.router.add_post('/api/add_device', self.handle_add_device)
+        self.app.router.add_post('/api/add_devices', self.handle_add_devices)
+        self.app.router.add_get('/api/channel_names', self.handle_channel_names)
+        self.app.router.add_post('/api/channel_names/refresh', self.handle_channel_names_refresh)
         self.app.router.add_post('/api/remove_device', self.handle_remove_device)
         self.app.router.add_post('/api/fix_entity_types', self.handle_fix_entity_types)
         self.app.router.add_get('/api/debug/messages', self.handle_debug_messages)
+        self.app.router.add_get('/api/debug/ws', self.handle_debug_ws)
         self.app.router.add_post('/api/debug/start', self.handle_debug_start)
         self.app.router.add_post('/api/debug/stop', self.handle_debug_stop)
         self.runner = None
         self.site = None
         self.protocol = TISProtocol(gateway_ip, udp_port)
-        self.debug_messages = []  # Store debug messages
+        self.bus = None  # Shared TIS bus, opened in start()
+        self.discovery_cache = DiscoveryCache()  # Warm start: devices from the last scan
+        self._discovery_task = None  # Running background/foreground scan (shared)
+        self._discovery_found = {}  # Devices found so far by the running scan
+        self._discovery_listeners = set()  # Event queues of open /api/devices/stream clients
+        self.passive = None  # PassiveDiscovery when enabled
+        self.state_engine = None  # Live channel states from bus traffic
+        self.channel_name_cache = ChannelNameCache()
+        # /config/tis_devices.json (TIS integration reads from here), optionally via SQLite
+        self.device_store = open_device_store(device_backend)
+        # Store/cache file I/O runs on one background thread, never on the event loop
+        self.io = IOWorker()
+        self.loop_lag = LoopLagMonitor()
+        # unique_ids in tis_devices.json, kept in memory; reloaded only when the file changes
+        self.added_ids = set()
+        self.device_watcher = FileWatcher(self.device_store.path, self._on_devices_file_changed)
+        self._added_ids_task = None
+        self._added_ids_stale = False
+        # Global limit on devices queried at once (single and bulk add share it)
+        self.query_semaphore = asyncio.Semaphore(BULK_QUERY_CONCURRENCY)
+        self.debug_history = deque(maxlen=DEBUG_HISTORY)  # Recent debug messages (never cleared by readers)
+        self.debug_seq = 0
+        self.debug_clients = set()  # DebugClient per open /api/debug/ws
         self.debug_listener = None  # UDP listener for debug mode
         self.debug_active = False  # Debug mode status
 
     async def start(self):
         """Start the web server."""
         try:
+            self.loop_lag.start()
+            await self._sync_added_ids()
+            self.device_watcher.start()
+            self.device_store.watching = self.device_watcher.mode == 'inotify'
             self.runner = web.AppRunner(self.app)
             await self.runner.setup()
             self.site = web.TCPSite(self.runner, '0.0.0.0', 8888)
             await self.site.start()
+            # One process-wide bus owns UDP port 6000; control commands, queries,
+            # discovery and the debug sniffer all share it
+            self.bus = await get_bus(self.gateway_ip, self.udp_port)
+            self.protocol = self.bus.client
+            self.state_engine = StateEngine(self.bus)
+            self.state_engine.start()
+            if self.passive_discovery:
+                # Sadece dinleyerek envanter - aktif tarama yapılmaz
+                self.passive = PassiveDiscovery(self.bus, self.discovery_cache, self.io)
+                self.passive.start()
+            elif not self.discovery_cache.is_fresh:
+                self._revalidate_discovery()
             _LOGGER.info("TIS Web UI started on port 8888")
             _LOGGER.info("Open http://homeassistant.local:8888 in your browser")
         except Exception as e:
@@ -54,10 +138,20 @@ class TISWebUI:
 
     async def stop(self):
         """Stop the web server."""
+        if self.passive:
+            await self.passive.stop()
+        if self.state_engine:
+            await self.state_engine.stop()
+        if self.bus:
+            await self.bus.stop()
         if self.site:
             await self.site.stop()
         if self.runner:
             await self.runner.cleanup()
+        await self.loop_lag.stop()
+        self.device_watcher.stop()
+        await self.io.run(self.device_store.close)
+        self.io.shutdown()
 
     async def handle_index(self, request):
         """Serve the HTML page."""
@@ -441,6 +535,7 @@ class TISWebUI:
                 <div class="toolbar">
                     <button id="scanBtn" class="primary" onclick="try { scanDevices(); } catch(e) { alert('JavaScript Error: ' + e.message); console.error('Button click error:', e); }">🔍 Scan Network</button>
                     <button onclick="refreshTable()">🔄 Refresh</button>
+                    <button onclick="addAllDevices()">➕ Add All</button>
                     <button onclick="fixEntityTypes()">🔧 Fix Entity Types</button>
                     <button onclick="toggleDebug()">🐛 Debug Tool</button>
                 </div>
@@ -471,6 +566,16 @@ class TISWebUI:
                     </table>
                 </div>
                 
+                <!-- Debug Panel (live bus frames over /api/debug/ws) -->
+                <div class="debug-panel" id="debugPanel" style="display: none;">
+                    <div class="debug-header">
+                        <strong>🐛 Live TIS Bus</strong>
+                        <span class="debug-time" id="debugStatus">Disconnected</span>
+                        <button onclick="document.getElementById('debugLogs').innerHTML = ''">Clear</button>
+                    </div>
+                    <div id="debugLogs"></div>
+                </div>
+                
                 <!-- Status Bar -->
                 <div class="statusbar">
                     <div id="statusText">Ready - Click "Scan Network" to discover devices</div>
@@ -487,11 +592,75 @@ class TISWebUI:
                 
                 // Sayfa yüklendiğinde hazır
                 window.addEventListener('DOMContentLoaded', async function() {
-                    console.log('Page loaded, ready for device scanning via TIS integration');
+                    console.log('Page loaded, ready for device scanning');
+                    loadCachedDevices();
                 });
                 
+                async function loadCachedDevices() {
+                    // Son taramanın sonuçlarını anında göster (tarama yapmadan)
+                    try {
+                        const response = await fetch('/api/devices?cached=1');
+                        const devices = await response.json();
+                        if (!devices.length) {
+                            return;
+                        }
+                        const tableBody = document.getElementById('devicesTableBody');
+                        tableBody.innerHTML = devices.map(createDeviceRow).join('');
+                        document.getElementById('deviceCount').innerText = `Total Devices: ${devices.length}`;
+                        const age = response.headers.get('X-Cache-Age');
+                        document.getElementById('statusText').innerText =
+                            `📦 ${devices.length} cached device(s)` + (age ? ` (last scan ${Math.round(age / 60)} min ago)` : '');
+                    } catch (e) {
+                        console.error('Cache load error:', e);
+                    }
+                }
+                
+                const DEBUG_MAX_LOGS = 500;
+                
                 function toggleDebug() {
-                    alert('Debug tool coming soon!');
+                    const panel = document.getElementById('debugPanel');
+                    debugMode = !debugMode;
+                    panel.style.display = debugMode ? 'block' : 'none';
+                    if (debugMode) {
+                        connectDebug();
+                    } else if (debugSocket) {
+                        debugSocket.close();
+                        debugSocket = null;
+                    }
+                }
+                
+                function connectDebug() {
+                    // Her sekme kendi bağlantısını açar; mesajlar sekmeler arasında bölünmez
+                    const status = document.getElementById('debugStatus');
+                    const proto = location.protocol === 'https:' ? 'wss:' : 'ws:';
+                    const socket = new WebSocket(`${proto}//${location.host}/api/debug/ws`);
+                    debugSocket = socket;
+                    status.innerText = 'Connecting...';
+                    socket.onopen = () => { status.innerText = '🟢 Live'; };
+                    socket.onmessage = (event) => {
+                        const batch = JSON.parse(event.data);
+                        batch.messages.forEach(addDebugLog);
+                        status.innerText = '🟢 Live' + (batch.dropped ? ` - ${batch.dropped} dropped` : '');
+                    };
+                    socket.onclose = () => {
+                        if (debugSocket !== socket) {
+                            return;
+                        }
+                        status.innerText = '🔴 Disconnected - reconnecting...';
+                        setTimeout(() => { if (debugMode && debugSocket === socket) connectDebug(); }, 2000);
+                    };
+                }
+                
+                function addDebugLog(message) {
+                    const logs = document.getElementById('debugLogs');
+                    const entry = document.createElement('div');
+                    entry.className = `debug-log ${message.type}`;
+                    const time = new Date(message.timestamp).toLocaleTimeString();
+                    entry.innerHTML = `<div class="debug-time">${time}</div><div class="debug-data">${message.data}</div>`;
+                    logs.insertBefore(entry, logs.firstChild);
+                    while (logs.childElementCount > DEBUG_MAX_LOGS) {
+                        logs.removeChild(logs.lastChild);
+                    }
                 }
                 
                 function refreshTable() {
@@ -512,8 +681,8 @@ class TISWebUI:
                     document.querySelectorAll('.toolbar button').forEach(b => b.disabled = true);
                     
                     btn.innerText = "⏳ Scanning...";
-                    statusText.innerText = "Scanning network via TIS integration...";
-                    tableBody.innerHTML = '<tr><td colspan="8" style="text-align: center; padding: 40px;"><div style="font-size: 32px;">⏳</div><div>Scanning network via TIS integration...</div></td></tr>';
+                    statusText.innerText = "Scanning TIS bus...";
+                    tableBody.innerHTML = '<tr><td colspan="8" style="text-align: center; padding: 40px;"><div style="font-size: 32px;">⏳</div><div>Scanning TIS bus...</div></td></tr>';
                     
                     // Progress bar başlat
                     progressContainer.classList.add('active');
@@ -559,6 +728,14 @@ class TISWebUI:
                             document.getElementById('deviceCount').innerText = `Total Devices: ${deviceCount}`;
                         });
                         
+                        eventSource.addEventListener('device_update', (e) => {
+                            const device = JSON.parse(e.data);
+                            const row = tableBody.querySelector(`tr[data-subnet="${device.subnet}"][data-device="${device.device}"]`);
+                            if (row) {
+                                row.outerHTML = createDeviceRow(device);
+                            }
+                        });
+                        
                         eventSource.addEventListener('complete', (e) => {
                             console.log('Scan completed');
                             clearInterval(progressTimer);
@@ -614,7 +791,10 @@ class TISWebUI:
                     }
                 }
 
+                const deviceIndex = {};  // subnet_device -> son taramadaki cihaz
+                
                 function createDeviceRow(dev) {
+                    deviceIndex[`${dev.subnet}_${dev.device}`] = dev;
                     const addedClass = dev.is_added ? 'added' : '';
                     const statusIcon = dev.is_added ? '<span class="status-icon added">✓</span>' : '';
                     
@@ -641,7 +821,7 @@ class TISWebUI:
                                 <button class="btn btn-primary" onclick="previewDevice(${dev.subnet}, ${dev.device}, '${dev.name}')" title="Preview device details">
                                     <span>👁️</span> Preview
                                 </button>
-                                <button class="btn btn-success" onclick="addDevice(${dev.subnet}, ${dev.device}, '${dev.model_name}', ${dev.channels}, '${dev.name}')" title="Add to Home Assistant">
+                                <button class="btn btn-success" onclick="addDevice(${dev.subnet}, ${dev.device}, '${dev.model_name}', ${dev.channels}, '${dev.name}', ${dev.device_type || 'null'})" title="Add to Home Assistant">
                                     <span>➕</span> Add
                                 </button>
                             </div>
@@ -649,7 +829,7 @@ class TISWebUI:
                     }
                     
                     return `
-                        <tr class="${addedClass}" data-subnet="${dev.subnet}" data-device="${dev.device}">
+                        <tr class="${addedClass}" data-subnet="${dev.subnet}" data-device="${dev.device}" data-device-type="${dev.device_type || ''}">
                             <td class="center">${statusIcon}</td>
                             <td>${dev.subnet}</td>
                             <td>${dev.device}</td>
@@ -686,8 +866,33 @@ class TISWebUI:
                     }
                 }
 
-                async function addDevice(subnet, deviceId, modelName, channels, deviceName) {
-                    if (!confirm(`Add device to Home Assistant?\\n\\n${deviceName}\\n\\nNote: This may take 20-30 seconds to query all channel names.`)) {
+                async function readNdjson(response, onEvent) {
+                    // NDJSON akışını satır satır oku, son olayı döndür
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    let last = null;
+                    while (true) {
+                        const {value, done} = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, {stream: true});
+                        const lines = buffer.split('\\n');
+                        buffer = lines.pop();
+                        for (const line of lines) {
+                            if (!line.trim()) continue;
+                            last = JSON.parse(line);
+                            onEvent(last);
+                        }
+                    }
+                    if (buffer.trim()) {
+                        last = JSON.parse(buffer);
+                        onEvent(last);
+                    }
+                    return last;
+                }
+
+                async function addDevice(subnet, deviceId, modelName, channels, deviceName, deviceType) {
+                    if (!confirm(`Add device to Home Assistant?\\n\\n${deviceName}`)) {
                         return;
                     }
 
@@ -696,17 +901,14 @@ class TISWebUI:
                         console.log(`📊 Model: ${modelName}, Channels: ${channels}`);
                         
                         // Show progress message immediately
-                        document.getElementById('statusText').innerText = `⏳ Adding ${deviceName}... (querying ${channels} channel names, please wait 20-30s)`;
+                        const statusText = document.getElementById('statusText');
+                        statusText.innerText = `⏳ Adding ${deviceName}... (querying ${channels} channel names and states)`;
                         console.log('⏳ Status: Sending add_device request...');
                         
-                        // Skip query_device step - it's unnecessary and just sends packets without waiting for response
-                        // Go directly to add_device which does all the real work
-                        
                         const startTime = Date.now();
                         
-                        // Add device (LONG operation - 15-20 seconds)
-                        // No timeout on fetch - let it complete naturally
-                        const response = await fetch('/api/add_device', {
+                        // Names and states are queried concurrently, each phase is streamed as it completes
+                        const response = await fetch('/api/add_device?stream=1', {
                             method: 'POST',
                             headers: {'Content-Type': 'application/json'},
                             body: JSON.stringify({
@@ -714,14 +916,22 @@ class TISWebUI:
                                 device_id: deviceId,
                                 model_name: modelName,
                                 channels: channels,
-                                device_name: deviceName
+                                device_name: deviceName,
+                                device_type: deviceType
                             })
                         });
                         
+                        const phaseLabels = {names: 'channel names', states: 'channel states', saved: 'saved'};
+                        const result = await readNdjson(response, (event) => {
+                            console.log('📥 Phase:', event);
+                            if (event.phase !== 'done') {
+                                const detail = event.count !== undefined ? ` (${event.count}/${event.channels})` : '';
+                                statusText.innerText = `⏳ ${deviceName}: ✓ ${phaseLabels[event.phase] || event.phase}${detail}`;
+                            }
+                        });
+                        
                         const elapsed = ((Date.now() - startTime) / 1000).toFixed(1);
                         console.log(`⏱️ Request completed in ${elapsed}s`);
-                        
-                        const result = await response.json();
                         console.log('📥 Server response:', result);
                         
                         if (result.success) {
@@ -760,6 +970,68 @@ class TISWebUI:
                     }
                 }
 
+                async function addAllDevices() {
+                    const pending = Array.from(document.querySelectorAll('#devicesTableBody tr[data-subnet]:not(.added)'))
+                        .map(row => deviceIndex[`${row.dataset.subnet}_${row.dataset.device}`])
+                        .filter(dev => dev);
+                    if (!pending.length) {
+                        alert('No new devices to add');
+                        return;
+                    }
+                    if (!confirm(`Add ${pending.length} device(s) to Home Assistant?`)) {
+                        return;
+                    }
+                    
+                    const statusText = document.getElementById('statusText');
+                    document.querySelectorAll('.toolbar button').forEach(b => b.disabled = true);
+                    try {
+                        const response = await fetch('/api/add_devices?stream=1', {
+                            method: 'POST',
+                            headers: {'Content-Type': 'application/json'},
+                            body: JSON.stringify({
+                                devices: pending.map(dev => ({
+                                    subnet: dev.subnet,
+                                    device_id: dev.device,
+                                    model_name: dev.model_name,
+                                    channels: dev.channels,
+                                    device_name: dev.name,
+                                    device_type: dev.device_type
+                                }))
+                            })
+                        });
+                        
+                        const result = await readNdjson(response, (event) => {
+                            if (event.phase === 'device' && event.error) {
+                                console.warn('Bulk add: device skipped', event);
+                            } else if (event.phase === 'device') {
+                                statusText.innerText = `⏳ Adding devices... ${event.done}/${event.total} (${event.unique_id})`;
+                            } else if (event.phase === 'saved') {
+                                statusText.innerText = `⏳ ${event.count} device(s) saved, reloading integration...`;
+                            }
+                        });
+                        
+                        if (result && result.success) {
+                            statusText.innerText = '✅ ' + result.message;
+                            alert(result.message);
+                            const failed = new Set((result.errors || []).map(e => e.index));
+                            pending.filter((dev, index) => !failed.has(index)).forEach(dev => {
+                                dev.is_added = true;
+                                const row = document.querySelector(`tr[data-subnet="${dev.subnet}"][data-device="${dev.device}"]`);
+                                if (row) {
+                                    row.outerHTML = createDeviceRow(dev);
+                                }
+                            });
+                        } else {
+                            alert('❌ Error: ' + (result ? result.message : 'no response'));
+                        }
+                    } catch (err) {
+                        console.error('❌ Exception during bulk add:', err);
+                        alert('❌ Error: ' + err.message);
+                    } finally {
+                        document.querySelectorAll('.toolbar button').forEach(b => b.disabled = false);
+                    }
+                }
+
                 async function removeDevice(subnet, deviceId, deviceName) {
                     if (!confirm(`Remove device "${deviceName}"?\\n\\nThis will remove the device from Home Assistant.`)) {
                         return;
@@ -792,12 +1064,13 @@ class TISWebUI:
                                 // Get model and channels from row
                                 const modelName = row.cells[3].textContent;
                                 const channels = row.cells[5].textContent;
+                                const deviceType = row.dataset.deviceType || 'null';
                                 actionsCell.innerHTML = `
                                     <div class="table-actions">
                                         <button class="btn btn-primary" onclick="previewDevice(${subnet}, ${deviceId}, '${safeName}')" title="Preview device details">
                                             <span>👁️</span> Preview
                                         </button>
-                                        <button class="btn btn-success" onclick="addDevice(${subnet}, ${deviceId}, '${modelName}', ${channels}, '${safeName}')" title="Add to Home Assistant">
+                                        <button class="btn btn-success" onclick="addDevice(${subnet}, ${deviceId}, '${modelName}', ${channels}, '${safeName}', ${deviceType})" title="Add to Home Assistant">
                                             <span>➕</span> Add
                                         </button>
                                     </div>
@@ -897,69 +1170,266 @@ class TISWebUI:
 
     async def handle_info(self, request):
         """Handle info request."""
-        import socket
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ha_ip = s.getsockname()[0]
-            s.close()
-        except:
-            ha_ip = "unknown"
+        ha_ip = get_local_ip()
         
         return web.json_response({
             'gateway_ip': self.gateway_ip,
             'udp_port': self.udp_port,
-            'ha_ip': ha_ip
+            'ha_ip': ha_ip,
+            'bus': self.bus.stats if self.bus else None,
+            'discovery': LAST_DISCOVERY_STATS or None,
+            'passive_discovery': self.passive.stats if self.passive else None,
+            'state_engine': self.state_engine.stats if self.state_engine else None,
+            'device_store': await self.io.run(lambda: self.device_store.stats),
+            'device_watcher': self.device_watcher.stats,
+            'debug': {'ws_clients': len(self.debug_clients), 'ws_dropped': sum(c.total_dropped for c in self.debug_clients)},
+            'io': self.io.stats,
+            'loop_lag': self.loop_lag.stats
         })
 
+    def _added_device_ids(self) -> set:
+        """unique_ids already written to /config/tis_devices.json (in memory)"""
+        return self.added_ids
+
+    async def _sync_added_ids(self):
+        self.added_ids = await self.io.run(self.device_store.ids)
+
+    def _on_devices_file_changed(self):
+        """tis_devices.json changed on disk (our own write or an external edit)."""
+        self.device_store.invalidate()
+        self._added_ids_stale = True
+        if self._added_ids_task is None or self._added_ids_task.done():
+            self._added_ids_task = asyncio.ensure_future(self._refresh_added_ids())
+
+    async def _refresh_added_ids(self):
+        # Değişiklikler yenileme sırasında gelirse bir tur daha
+        while self._added_ids_stale:
+            self._added_ids_stale = False
+            await self._sync_added_ids()
+
+    def _refresh_discovery(self, gateway_ip=None) -> asyncio.Future:
+        """Start a scan that updates the discovery cache, or join the running one."""
+        if self._discovery_task is None or self._discovery_task.done():
+            self._discovery_found = {}
+            self._discovery_task = asyncio.ensure_future(
+                self._run_discovery_scan(gateway_ip or self.gateway_ip, self._discovery_found))
+        return self._discovery_task
+
+    def _publish_discovery(self, kind: str, info: dict):
+        for queue in self._discovery_listeners:
+            queue.put_nowait((kind, info))
+
+    def _revalidate_discovery(self):
+        """Stale-while-revalidate: refresh the cache in the background."""
+        self._refresh_discovery().add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def _run_discovery_scan(self, gateway_ip, found: dict):
+        """The one running scan; events are fanned out to every open SSE stream."""
+        # Add debug log for discovery start
+        self._debug_event('send', f'Discovery başlatıldı - Gateway: {gateway_ip}, Port: {self.udp_port}')
+        
+        stats = None
+        try:
+            bus = self.bus or await get_bus(gateway_ip, self.udp_port)
+            async for kind, info in iter_discovery(bus):
+                if kind == 'complete':
+                    stats = info
+                    break
+                found[f"tis_{info['subnet']}_{info['device']}"] = info
+                self._publish_discovery(kind, info)
+            self.discovery_cache.update(found)
+            await self.discovery_cache.save_async(self.io)
+        finally:
+            if stats is None:
+                self._publish_discovery('error', {'message': 'Discovery aborted'})
+            else:
+                self._publish_discovery('complete', stats)
+        
+        # Add debug log for discovery result
+        self._debug_event('receive', f'Discovery tamamlandı - {len(found)} cihaz bulundu')
+        return found
+
     async def handle_devices(self, request):
-        """Handle device list request."""
+        """Handle device list request.
+        
+        Served from the discovery cache. A stale cache is returned immediately and
+        revalidated in the background; ?refresh=1 (or an empty cache) waits for a
+        fresh scan, ?cached=1 never scans.
+        """
         # Get gateway from query parameter or use default
         gateway_ip = request.query.get('gateway', self.gateway_ip)
+        refresh = request.query.get('refresh') in ('1', 'true')
+        cached_only = request.query.get('cached') in ('1', 'true')
         
-        # Add debug log for discovery start
-        self.debug_messages.append({
-            'type': 'send',
-            'data': f'Discovery başlatıldı - Gateway: {gateway_ip}, Port: {self.udp_port}',
-            'timestamp': asyncio.get_event_loop().time() * 1000
-        })
+        cache = self.discovery_cache
+        if self.passive and not refresh:
+            # Pasif modda envanter trafikten güncellenir, arka plan taraması yok
+            cached_only = True
+        if refresh or (not cache.devices and cache.age is None and not cached_only):
+            await asyncio.shield(self._refresh_discovery(gateway_ip))
+            cache_state = 'refreshed'
+        elif cache.is_fresh:
+            cache_state = 'fresh'
+        else:
+            cache_state = 'stale'
+            if not cached_only:
+                self._revalidate_discovery()
         
-        devices = await discover_tis_devices(gateway_ip, self.udp_port)
+        # Mark devices as already added
+        added_devices = self._added_device_ids()
+        devices_list = cache.device_list()
+        for device in devices_list:
+            # Discovery returns 'device', not 'device_id'
+            device['is_added'] = f"tis_{device.get('subnet')}_{device.get('device')}" in added_devices
         
-        # Add debug log for discovery result
-        self.debug_messages.append({
-            'type': 'receive',
-            'data': f'Discovery tamamlandı - {len(devices)} cihaz bulundu',
-            'timestamp': asyncio.get_event_loop().time() * 1000
+        age = cache.age
+        return web.json_response(devices_list, headers={
+            'X-Cache': cache_state,
+            'X-Cache-Age': str(int(age)) if age is not None else '',
         })
+
+    async def _known_devices(self) -> dict:
+        """Devices from the discovery cache plus those already added to Home Assistant."""
+        known = {uid: dict(device) for uid, device in self.discovery_cache.devices.items()}
+        for unique_id, device in (await self.io.run(self.device_store.all)).items():
+            if unique_id not in known and device.get('subnet') is not None:
+                known[unique_id] = {
+                    'subnet': device['subnet'],
+                    'device': device.get('device_id'),
+                    'model_name': device.get('model_name'),
+                    'channels': device.get('channels'),
+                    'name': device.get('name'),
+                }
+        return known
+
+    async def handle_devices_sweep(self, request):
+        """Differential rescan: unicast liveness of known devices (+ one broadcast for new ones)."""
+        gateway_ip = request.query.get('gateway', self.gateway_ip)
+        find_new = request.query.get('find_new', '1') not in ('0', 'false')
+        try:
+            window = int(request.query.get('window', 16))
+        except ValueError:
+            return web.json_response({'success': False, 'message': 'Geçersiz parametre'}, status=400)
+        if not 1 <= window <= 256:
+            return web.json_response({'success': False, 'message': 'window 1-256 olmalı'}, status=400)
         
-        # Load already added devices from JSON
-        import json
-        added_devices = set()
+        known = await self._known_devices()
+        started = time.monotonic()
+        result = await rescan_tis_devices(gateway_ip, known, self.udp_port, find_new=find_new, window=window)
+        elapsed = time.monotonic() - started
+        
+        # Cevap verenler ve yeni bulunanlar cache'de last_seen ile güncellenir. Sadece
+        # tis_devices.json'da olan kayıtlar (host/device_type yok) cache'e eklenmez.
+        cache = self.discovery_cache
+        for unique_id, device in result['devices'].items():
+            if unique_id not in cache.devices:
+                continue
+            if device['online']:
+                cache.touch(unique_id, device)
+            else:
+                cache.devices[unique_id].update(online=False, rtt_ms=None, checked_at=device['checked_at'])
+        for unique_id, device in result['new'].items():
+            cache.touch(unique_id, dict(device, online=True))
+        await cache.save_async(self.io)
+        
+        added_devices = self._added_device_ids()
+        devices_list = sorted(list(result['devices'].values()) + [dict(d, online=True) for d in result['new'].values()],
+                              key=lambda d: (d.get('subnet') or 0, d.get('device') or 0))
+        for device in devices_list:
+            device['is_added'] = f"tis_{device.get('subnet')}_{device.get('device')}" in added_devices
+        
+        online = sum(1 for device in result['devices'].values() if device['online'])
+        return web.json_response({
+            'devices': devices_list,
+            'stats': {
+                'known': len(known),
+                'online': online,
+                'offline': len(known) - online,
+                'new': len(result['new']),
+                'elapsed': round(elapsed, 2),
+            }
+        })
+
+    async def handle_snapshot(self, request):
+        """Current channel states of every registered device in one consolidated table."""
         try:
-            with open('/config/tis_devices.json', 'r') as f:
-                existing_devices = json.load(f)
-                # Extract unique_ids: tis_{subnet}_{device_id}
-                added_devices = set(existing_devices.keys())
-                _LOGGER.info(f"Found {len(added_devices)} already added devices")
-        except FileNotFoundError:
-            _LOGGER.info("No existing devices found")
-        except Exception as e:
-            _LOGGER.warning(f"Error reading existing devices: {e}")
+            window = int(request.query.get('window', 16))
+            deadline = float(request.query.get('deadline', 15))
+        except ValueError:
+            return web.json_response({'success': False, 'message': 'Geçersiz parametre'}, status=400)
         
-        # Mark devices as already added
-        devices_list = []
-        for device in devices.values():
-            subnet = device.get('subnet')
-            device_id = device.get('device')  # Discovery returns 'device', not 'device_id'
-            unique_id = f"tis_{subnet}_{device_id}"
-            
-            # Add 'is_added' flag
-            device['is_added'] = unique_id in added_devices
-            _LOGGER.debug(f"Device {unique_id}: is_added={device['is_added']}")
-            devices_list.append(device)
+        registered = await self.io.run(self.device_store.all)
+        hosts = self.discovery_cache.devices
+        devices = {
+            unique_id: {
+                'subnet': device['subnet'],
+                'device': device['device_id'],
+                'channels': device.get('channels'),
+                'host': hosts.get(unique_id, {}).get('host'),
+            }
+            for unique_id, device in registered.items()
+            if device.get('subnet') is not None and device.get('device_id') is not None
+        }
+        
+        bus = self.bus or await get_bus(self.gateway_ip, self.udp_port)
+        started = time.monotonic()
+        results = await snapshot_device_states(bus.correlator, devices, window=window, deadline=deadline)
+        elapsed = time.monotonic() - started
+        
+        # Ham kanal değerleri; ?view=expanded kanal başına is_on/brightness da ekler
+        expanded = request.query.get('view') == 'expanded'
+        for unique_id, result in results.items():
+            result['name'] = registered[unique_id].get('name')
+            states = result['states']
+            if states is not None:
+                result['states'] = states.expanded() if expanded else list(states.values)
+        online = sum(1 for result in results.values() if result['online'])
+        return web.json_response({
+            'success': True,
+            'devices': results,
+            'stats': {
+                'total': len(results),
+                'online': online,
+                'offline': len(results) - online,
+                'elapsed': round(elapsed, 2),
+            }
+        })
+
+    async def handle_state(self, request):
+        """Live channel states from memory (no bus round-trip).
+        
+        ?subnet=&device_id= returns one device, otherwise all known devices.
+        ?view=expanded adds per-channel is_on/brightness.
+        """
+        expanded = request.query.get('view') == 'expanded'
+        if self.state_engine is None:
+            return web.json_response({'success': False, 'message': 'State engine not running'}, status=503)
+        
+        if 'subnet' in request.query or 'device_id' in request.query:
+            try:
+                subnet = int(request.query['subnet'])
+                device_id = int(request.query['device_id'])
+            except (KeyError, ValueError):
+                return web.json_response({'success': False, 'message': 'Eksik parametreler'}, status=400)
+            state = self.state_engine.get(subnet, device_id)
+            if state is None:
+                return web.json_response({'success': False, 'message': 'Durum bilinmiyor'}, status=404)
+            return web.json_response(dict(state.to_dict(expanded), success=True, subnet=subnet, device_id=device_id))
         
-        return web.json_response(devices_list)
+        return web.json_response({'success': True, 'devices': self.state_engine.snapshot(expanded)})
+
+    async def handle_registry(self, request):
+        """Added devices filtered by ?subnet=&device_id=&model=&entity_type=&room= (all optional)."""
+        criteria = {key: request.query.get(key) for key in ('subnet', 'device_id', 'model', 'entity_type', 'room')}
+        try:
+            for key in ('subnet', 'device_id'):
+                if criteria[key] is not None:
+                    criteria[key] = int(criteria[key])
+        except ValueError:
+            return web.json_response({'success': False, 'message': 'Geçersiz parametreler'}, status=400)
+        
+        devices = await self.io.run(self.device_store.filter, **criteria)
+        return web.json_response({'success': True, 'count': len(devices), 'devices': devices})
 
     async def handle_devices_stream(self, request):
         """Handle device discovery with real-time streaming."""
@@ -977,81 +1447,45 @@ class TISWebUI:
         gateway_ip = request.query.get('gateway', self.gateway_ip)
         
         # Load already added devices
-        added_devices = set()
-        try:
-            with open('/config/tis_devices.json', 'r') as f:
-                existing_devices = json.load(f)
-                added_devices = set(existing_devices.keys())
-        except:
-            pass
+        added_devices = self._added_device_ids()
         
         # Send start event
         await response.write(b'event: start\n')
-        await response.write(b'data: {"message": "Scanning network via TIS integration..."}\n\n')
+        await response.write(b'data: {"message": "Scanning TIS bus..."}\n\n')
         
+        count = 0
+        # Tarama paylaşılır: çalışan bir tarama varsa (ör. arka plan yenilemesi)
+        # yeni broadcast yapılmaz, o taramanın olayları izlenir
+        events = asyncio.Queue()
+        self._discovery_listeners.add(events)
         try:
-            # Call Home Assistant's TIS integration scan endpoint
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                # Use local Home Assistant API
-                scan_url = 'http://homeassistant.local:8123/api/scan_devices'
-                _LOGGER.info(f"Calling TIS integration scan endpoint: {scan_url}")
+            self._refresh_discovery(gateway_ip)
+            for info in list(self._discovery_found.values()):
+                events.put_nowait(('device', info))  # Katılmadan önce bulunanlar
+            while True:
+                kind, info = await events.get()
+                if kind == 'error':
+                    raise RuntimeError(info['message'])
+                if kind == 'complete':
+                    # Send completion event
+                    complete_data = json.dumps({'count': count, 'stats': info})
+                    await response.write(f'event: complete\ndata: {complete_data}\n\n'.encode())
+                    break
                 
-                async with session.get(scan_url, timeout=aiohttp.ClientTimeout(total=35)) as resp:
-                    if resp.status == 200:
-                        devices_data = await resp.json()
-                        _LOGGER.info(f"Received {len(devices_data)} devices from integration")
-                        
-                        # Convert integration format to our format and stream
-                        for device in devices_data:
-                            try:
-                                # Extract device info from integration response
-                                device_id_parts = device.get('device_id', [])
-                                if len(device_id_parts) >= 2:
-                                    subnet = device_id_parts[0]
-                                    device_id = device_id_parts[1]
-                                    unique_id = f"tis_{subnet}_{device_id}"
-                                    
-                                    # Get device type info
-                                    from const import get_device_info
-                                    device_type_code = device.get('device_type_code', [0xFFFE, 0xFFFE])
-                                    device_type_int = (device_type_code[0] << 8) | device_type_code[1]
-                                    model_name, channels = get_device_info(device_type_int)
-                                    
-                                    if model_name != "Unknown Device":
-                                        device_info = {
-                                            "host": '.'.join(map(str, device.get('gateway', []))),
-                                            "subnet": subnet,
-                                            "device": device_id,
-                                            "device_type": device_type_int,
-                                            "device_type_hex": f"0x{device_type_int:04X}",
-                                            "model_name": model_name,
-                                            "channels": channels,
-                                            "name": f"{model_name} ({subnet}.{device_id})",
-                                            "is_added": unique_id in added_devices
-                                        }
-                                        
-                                        # Send device event
-                                        device_json = json.dumps(device_info)
-                                        await response.write(b'event: device\n')
-                                        data_line = f'data: {device_json}\n\n'
-                                        await response.write(data_line.encode())
-                            except Exception as e:
-                                _LOGGER.error(f"Error processing device: {e}")
-                        
-                        # Send completion event
-                        await response.write(b'event: complete\n')
-                        complete_data = f'data: {{\"count\": {len(devices_data)}}}\n\n'
-                        await response.write(complete_data.encode())
-                    else:
-                        _LOGGER.error(f"Integration scan failed: HTTP {resp.status}")
-                        await response.write(b'event: error\n')
-                        await response.write(b'data: {"message": "Integration scan failed"}\n\n')
+                if kind == 'device':
+                    count += 1
+                info = dict(info, is_added=f"tis_{info['subnet']}_{info['device']}" in added_devices)
+                
+                # Send device event (later name updates as device_update)
+                event_name = 'device' if kind == 'device' else 'device_update'
+                await response.write(f'event: {event_name}\ndata: {json.dumps(info)}\n\n'.encode())
         except Exception as e:
-            _LOGGER.error(f"Failed to call integration scan: {e}", exc_info=True)
+            _LOGGER.error(f"Discovery stream failed: {e}", exc_info=True)
             await response.write(b'event: error\n')
-            error_msg = f'data: {{\"message\": \"Error: {str(e)}\"}}\n\n'
-            await response.write(error_msg.encode())
+            error_msg = json.dumps({'message': f'Error: {e}'})
+            await response.write(f'data: {error_msg}\n\n'.encode())
+        finally:
+            self._discovery_listeners.discard(events)
         
         return response
 
@@ -1068,21 +1502,13 @@ class TISWebUI:
                 return web.json_response({'success': False, 'message': 'Eksik parametreler'}, status=400)
 
             # Add debug log
-            self.debug_messages.append({
-                'type': 'send',
-                'data': f'Kontrol komutu - Subnet: {subnet}, Device: {device_id}, State: {state}, Channel: {channel}',
-                'timestamp': asyncio.get_event_loop().time() * 1000
-            })
+            self._debug_event('send', f'Kontrol komutu - Subnet: {subnet}, Device: {device_id}, State: {state}, Channel: {channel}')
 
             # Send control command
             await self.protocol.send_control_command(subnet, device_id, channel, state)
             
             # Add debug log
-            self.debug_messages.append({
-                'type': 'receive',
-                'data': f'Komut gönderildi - Yanıt bekleniyor...',
-                'timestamp': asyncio.get_event_loop().time() * 1000
-            })
+            self._debug_event('receive', f'Komut gönderildi - Yanıt bekleniyor...')
             
             return web.json_response({'success': True})
         except Exception as e:
@@ -1101,79 +1527,124 @@ class TISWebUI:
 
             _LOGGER.info(f"🔍 Querying device info: {subnet}.{device_id}")
 
-            # Send OpCode 0xEFFD (Model query) and 0x0003 (Device type query)
-            client = TISUDPClient(self.gateway_ip, self.udp_port)
-            await client.async_connect(bind=False)  # Send only, no need to bind
-            
-            # Get local IP for SMARTCLOUD header
-            from discovery import get_local_ip
-            local_ip = get_local_ip()
-            ip_bytes = bytes([int(x) for x in local_ip.split('.')])
-            
-            # Determine target: Use gateway IP from query parameter if available, otherwise use self.gateway_ip
-            # If gateway is 0.0.0.0, use broadcast
-            target_ip = self.gateway_ip
-            if target_ip == '0.0.0.0' or not target_ip:
-                target_ip = '<broadcast>'
-            
-            # OpCode 0xEFFD: Model query
-            packet_effd = TISPacket()
-            packet_effd.src_subnet = 1
-            packet_effd.src_device = 254
-            packet_effd.src_type = 0xFFFE
-            packet_effd.tgt_subnet = subnet
-            packet_effd.tgt_device = device_id
-            packet_effd.op_code = 0xEFFD
-            packet_effd.additional_data = b''
-            
-            tis_data_effd = packet_effd.build()
-            full_packet_effd = ip_bytes + b'SMARTCLOUD' + tis_data_effd
-            
-            if target_ip == '<broadcast>':
-                client.send_broadcast(full_packet_effd)
-            else:
-                client.send_to(full_packet_effd, target_ip)
-            _LOGGER.debug(f"Sent OpCode 0xEFFD (Model query) to {subnet}.{device_id} via {target_ip}")
-            
-            # OpCode 0x0003: Device type query
-            packet_0003 = TISPacket()
-            packet_0003.src_subnet = 1
-            packet_0003.src_device = 254
-            packet_0003.src_type = 0xFFFE
-            packet_0003.tgt_subnet = subnet
-            packet_0003.tgt_device = device_id
-            packet_0003.op_code = 0x0003
-            packet_0003.additional_data = b''
-            
-            tis_data_0003 = packet_0003.build()
-            full_packet_0003 = ip_bytes + b'SMARTCLOUD' + tis_data_0003
-            
-            if target_ip == '<broadcast>':
-                client.send_broadcast(full_packet_0003)
-            else:
-                client.send_to(full_packet_0003, target_ip)
-            _LOGGER.debug(f"Sent OpCode 0x0003 (Device type query) to {subnet}.{device_id} via {target_ip}")
+            # Send OpCode 0xEFFD (Model query) and 0x0003 (Device type query) concurrently,
+            # replies are matched by the correlator instead of a hand-rolled receive loop
+            bus = await get_bus(self.gateway_ip, self.udp_port)
+            effe, resp_0004 = await asyncio.gather(
+                bus.request(subnet, device_id, 0xEFFD, timeout=2.0),
+                bus.request(subnet, device_id, 0x0003, timeout=2.0),
+            )
             
-            client.close()
+            responses = {}
+            if effe:
+                responses['0xEFFE'] = effe['additional_data'].hex()
+            if resp_0004:
+                responses['0x0004'] = resp_0004['additional_data'].hex()
+            _LOGGER.debug(f"Device info replies from {subnet}.{device_id}: {responses}")
             
             return web.json_response({
                 'success': True,
-                'message': f'Discovery messages sent to {subnet}.{device_id}'
+                'message': f'Discovery messages sent to {subnet}.{device_id}',
+                'responses': responses
             })
         except Exception as e:
             _LOGGER.error(f"Query device error: {e}")
             return web.json_response({'success': False, 'message': str(e)}, status=500)
 
+    def _debug_message(self, msg_type: str, data: str, timestamp: float = None, **extra) -> dict:
+        """Numbered debug message; kept in the history for polling clients."""
+        self.debug_seq += 1
+        message = dict(extra, seq=self.debug_seq, type=msg_type, data=data,
+                       timestamp=timestamp if timestamp is not None else time.time() * 1000)
+        self.debug_history.append(message)
+        return message
+
+    def _debug_event(self, msg_type: str, data: str):
+        """Add-on side event (control command, discovery) - also pushed to every WebSocket client."""
+        message = self._debug_message(msg_type, data)
+        for client in self.debug_clients:
+            client.put(message)
+
     async def handle_debug_messages(self, request):
-        """Handle debug messages request."""
+        """Recent debug messages newer than ?since=<seq> (nothing is cleared, every tab sees all)."""
         try:
-            # Return and clear messages
-            messages = self.debug_messages.copy()
-            self.debug_messages.clear()
-            return web.json_response(messages)
-        except Exception as e:
-            _LOGGER.error(f"Debug messages error: {e}")
-            return web.json_response([], status=500)
+            since = int(request.query.get('since', 0))
+        except ValueError:
+            return web.json_response([], status=400)
+        return web.json_response([message for message in self.debug_history if message['seq'] > since])
+
+    async def handle_debug_ws(self, request):
+        """Live decoded bus frames and add-on events over a WebSocket.
+        
+        Each client has its own bounded bus subscription, so a slow browser tab
+        only drops its own messages; the drop count is sent with every batch.
+        ?op_codes=0x0031,0x0032 limits the stream to those OpCodes.
+        """
+        try:
+            op_codes = [int(code, 0) for code in request.query['op_codes'].split(',')] \
+                if request.query.get('op_codes') else None
+        except ValueError:
+            return web.json_response({'success': False, 'message': 'Geçersiz op_codes'}, status=400)
+        
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        bus = self.bus or await get_bus(self.gateway_ip, self.udp_port)
+        client = DebugClient()
+        self.debug_clients.add(client)
+        _LOGGER.info(f"Debug WebSocket connected ({len(self.debug_clients)} client(s))")
+        
+        with bus.subscribe(op_codes=op_codes, include_invalid=op_codes is None, maxsize=DEBUG_CLIENT_QUEUE) as sub:
+            client.sub = sub
+            sender = asyncio.ensure_future(self._debug_ws_sender(ws, sub, client))
+            try:
+                async for msg in ws:
+                    if msg.type == WSMsgType.ERROR:
+                        break
+            finally:
+                sender.cancel()
+                try:
+                    await sender
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    _LOGGER.debug(f"Debug WebSocket sender stopped: {e}")
+                self.debug_clients.discard(client)
+                _LOGGER.info(f"Debug WebSocket closed (dropped {client.total_dropped})")
+        return ws
+
+    async def _debug_ws_sender(self, ws, sub, client):
+        """Forward bus frames and add-on events to one client, in batches."""
+        frame_get = asyncio.ensure_future(sub.queue.get())
+        event_get = asyncio.ensure_future(client.queue.get())
+        try:
+            while not ws.closed:
+                done, _ = await asyncio.wait({frame_get, event_get}, return_when=asyncio.FIRST_COMPLETED)
+                messages = []
+                if event_get in done:
+                    messages.append(event_get.result())
+                    while not client.queue.empty() and len(messages) < DEBUG_BATCH:
+                        messages.append(client.queue.get_nowait())
+                    event_get = asyncio.ensure_future(client.queue.get())
+                if frame_get in done:
+                    frames = [frame_get.result()]
+                    # Yoğun bus'ta sırada bekleyen paketler tek mesajda gider
+                    while not sub.queue.empty() and len(frames) < DEBUG_BATCH:
+                        frames.append(sub.queue.get_nowait())
+                    messages.extend(self._debug_frame(parsed, ip, data) for parsed, ip, data in frames)
+                    frame_get = asyncio.ensure_future(sub.queue.get())
+                await ws.send_json({'messages': messages, 'dropped': client.total_dropped})
+        finally:
+            frame_get.cancel()
+            event_get.cancel()
+
+    def _debug_frame(self, parsed, ip, data) -> dict:
+        """One received datagram as a WebSocket debug message."""
+        return {
+            'type': 'receive',
+            'data': self._parse_packet_for_debug(parsed, data, (ip, self.udp_port)),
+            'timestamp': time.time() * 1000,
+            'op_code': parsed['op_code'] if parsed is not None else None,
+        }
     
     async def handle_debug_start(self, request):
         """Start debug UDP listener."""
@@ -1205,49 +1676,35 @@ class TISWebUI:
     
     async def _udp_debug_listener(self):
         """Listen to UDP packets for debug."""
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        sock.setblocking(False)
-        sock.bind(('', self.udp_port))
+        bus = await get_bus(self.gateway_ip, self.udp_port)
         
-        _LOGGER.info(f"Debug listener bound to port {self.udp_port}")
+        _LOGGER.info(f"Debug listener subscribed to bus on port {self.udp_port}")
         
         try:
-            while self.debug_active:
-                try:
-                    # Non-blocking receive with timeout
-                    await asyncio.sleep(0.1)
-                    
+            with bus.subscribe(include_invalid=True, maxsize=1024) as sub:
+                while self.debug_active:
                     try:
-                        data, addr = sock.recvfrom(4096)
+                        parsed, ip, data = await sub.get()
                         
                         # Parse packet info
-                        packet_info = self._parse_packet_for_debug(data, addr)
+                        packet_info = self._parse_packet_for_debug(parsed, data, (ip, self.udp_port))
                         
-                        self.debug_messages.append({
-                            'type': 'receive',
-                            'data': packet_info,
-                            'timestamp': time.time() * 1000
-                        })
+                        # Polling clients read the history; WebSocket clients have their own subscription
+                        self._debug_message('receive', packet_info)
                         
-                        # Keep only last 50 messages
-                        if len(self.debug_messages) > 50:
-                            self.debug_messages = self.debug_messages[-50:]
-                            
-                    except BlockingIOError:
-                        pass
-                    
-                except asyncio.CancelledError:
-                    break
-                except Exception as e:
-                    _LOGGER.error(f"Debug listener error: {e}")
+                    except asyncio.CancelledError:
+                        break
+                    except Exception as e:
+                        _LOGGER.error(f"Debug listener error: {e}")
         finally:
-            sock.close()
             _LOGGER.info("Debug listener closed")
     
-    def _parse_packet_for_debug(self, data, addr):
-        """Parse packet data for debug display."""
+    def _parse_packet_for_debug(self, parsed, data, addr):
+        """Debug display of one bus frame.
+        
+        parsed is the TISFrame decoded by the bus (one per packet, even when a
+        datagram carries several); None for a datagram that could not be decoded.
+        """
         try:
             ip, port = addr
             
@@ -1257,15 +1714,8 @@ class TISWebUI:
                 has_smartcloud = True
                 source_ip_bytes = data[0:4]
                 source_ip = '.'.join(str(b) for b in source_ip_bytes)
-                tis_data = data[14:]
-            else:
-                source_ip = ip
-                tis_data = data
-            
-            # Try to parse TIS packet
-            parsed = TISPacket.parse(tis_data)
             
-            if parsed:
+            if parsed is not None:
                 op_code = parsed.get('op_code', 0)
                 src_subnet = parsed.get('src_subnet', 0)
                 src_device = parsed.get('src_device', 0)
@@ -1295,7 +1745,8 @@ class TISWebUI:
                 if extra_info:
                     info += extra_info
                 
-                # Add hex dump
+                # Add hex dump (this packet only, AA AA .. CRC)
+                tis_data = parsed.packet
                 hex_dump = ' '.join(f'{b:02X}' for b in tis_data[:32])
                 if len(tis_data) > 32:
                     hex_dump += '...'
@@ -1441,8 +1892,108 @@ class TISWebUI:
         _LOGGER.warning(f"No specific entity type found for {model_name}, defaulting to 'switch'")
         return 'switch'
 
+    def _default_channel_names(self, model_name: str):
+        """Appliance counts for a model and channel names generated from them."""
+        from const import DEVICE_APPLIANCE_COUNTS, DEFAULT_CHANNEL_NAMES
+        appliance_counts = DEVICE_APPLIANCE_COUNTS.get(model_name, {})
+        channel_names = {}
+        
+        # Generate default channel names if we know the appliance structure
+        if appliance_counts:
+            channel_idx = 1
+            for appliance_type, count in appliance_counts.items():
+                for i in range(count):
+                    # Get default name template for this appliance type
+                    default_names = DEFAULT_CHANNEL_NAMES.get(appliance_type, {})
+                    if len(default_names) == 1:
+                        # Single name type (e.g., switch, dimmer)
+                        channel_names[str(channel_idx)] = f"{default_names[1]} {i+1}"
+                    else:
+                        # Multi-name type (e.g., rgbw has 4 names)
+                        name_key = (i % len(default_names)) + 1
+                        channel_names[str(channel_idx)] = default_names.get(name_key, f"Channel {channel_idx}")
+                    channel_idx += 1
+            _LOGGER.info(f"Generated {len(channel_names)} default channel names from appliance counts")
+        return appliance_counts, channel_names
+
+    async def _query_device_details(self, subnet: int, device_id: int, channels: int, device_type: int = None,
+                                    refresh_names: bool = False, on_phase=None):
+        """Query channel names and initial states concurrently on the shared bus.
+        
+        on_phase(phase, result) is awaited as each query finishes ('names' / 'states').
+        Returns (channel_names, initial_states).
+        """
+        async def phase(name, coro, empty):
+            try:
+                result = await coro
+            except Exception as e:
+                _LOGGER.error(f"Failed to query {name} for {subnet}.{device_id}: {e}", exc_info=True)
+                result = empty
+            if on_phase:
+                await on_phase(name, result)
+            return result
+        
+        async with self.query_semaphore:
+            channel_names, initial_states = await asyncio.gather(
+                phase('names', self._query_channel_names(subnet, device_id, channels, device_type, refresh_names), {}),
+                phase('states', self._query_initial_states(subnet, device_id, channels), ChannelStates()),
+            )
+        return channel_names, initial_states
+
+    def _build_device_record(self, subnet: int, device_id: int, model_name: str, channels: int, device_name: str,
+                             device_type: int, channel_names: dict, initial_states: ChannelStates,
+                             appliance_counts: dict) -> dict:
+        """tis_devices.json entry for one device.
+        
+        States are kept as compact ChannelStates everywhere else; the integration
+        reads the expanded per-channel form, so it is only built here.
+        """
+        # Detect entity type from device_type_code (not model name!)
+        from const import get_appliance_type
+        entity_type = get_appliance_type(device_type) if device_type else self._detect_entity_type(model_name)
+        
+        device_type_hex = f"0x{device_type:04X}" if device_type else "None"
+        _LOGGER.info(f"Detected entity type: {entity_type} for device {device_type_hex} ({model_name})")
+        
+        return {
+            'subnet': subnet,
+            'device_id': device_id,
+            'model_name': model_name,
+            'channels': channels,
+            'name': device_name or f"{model_name} ({subnet}.{device_id})",
+            'channel_names': channel_names,  # Add channel names to JSON
+            'initial_states': initial_states.expanded(),  # Add initial states (integration format)
+            'entity_type': entity_type,  # NEW: Entity type for HA
+            'appliance_counts': appliance_counts  # NEW: Detailed appliance breakdown
+        }
+
+    async def _save_device_records(self, records: dict):
+        """Merge records into /config/tis_devices.json (TIS integration reads from here)."""
+        await self.io.run(self.device_store.upsert, records)
+        self.added_ids = self.added_ids | set(records)
+
     async def handle_add_device(self, request):
-        """Handle add device to Home Assistant request."""
+        """Handle add device to Home Assistant request.
+        
+        With ?stream=1 the response is NDJSON, one line per finished phase
+        (names, states, saved, done), so the UI can show progress.
+        """
+        stream = None
+        if request.query.get('stream') in ('1', 'true'):
+            stream = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache'})
+            await stream.prepare(request)
+        
+        async def emit(event: dict):
+            if stream is not None:
+                await stream.write((json.dumps(event) + '\n').encode())
+        
+        async def finish(result: dict, status: int = 200):
+            if stream is None:
+                return web.json_response(result, status=status)
+            await emit(dict(result, phase='done'))
+            await stream.write_eof()
+            return stream
+        
         try:
             data = await request.json()
             subnet = data.get('subnet')
@@ -1450,122 +2001,222 @@ class TISWebUI:
             model_name = data.get('model_name')
             channels = data.get('channels', 1)
             device_name = data.get('device_name')
-            device_type = data.get('device_type')  # Get device_type int
+            try:
+                device_type = _parse_device_type(data.get('device_type'))
+            except (TypeError, ValueError):
+                return await finish({'success': False, 'message': 'Geçersiz device_type'}, status=400)
+            refresh_names = bool(data.get('refresh_names'))
 
             device_type_hex = f"0x{device_type:04X}" if device_type else "None"
             _LOGGER.info(f"📥 Add device request: subnet={subnet}, device_id={device_id}, model={model_name}, channels={channels}, name={device_name}, type={device_type_hex}")
 
             if not all([subnet, device_id, model_name]):
-                return web.json_response({'success': False, 'message': 'Eksik parametreler'}, status=400)
+                return await finish({'success': False, 'message': 'Eksik parametreler'}, status=400)
 
             _LOGGER.info(f"Adding device: {subnet}.{device_id} - {device_name} ({channels} channels)")
             
             # Get appliance counts from database if available
-            from const import DEVICE_APPLIANCE_COUNTS, DEFAULT_CHANNEL_NAMES
-            appliance_counts = DEVICE_APPLIANCE_COUNTS.get(model_name, {})
+            appliance_counts, channel_names = self._default_channel_names(model_name)
             _LOGGER.info(f"Appliance counts for {model_name}: {appliance_counts}")
             
-            # Query channel names from device BEFORE saving
-            channel_names = {}
-            initial_states = {}
-            
-            # Generate default channel names if we know the appliance structure
-            if appliance_counts:
-                channel_idx = 1
-                for appliance_type, count in appliance_counts.items():
-                    for i in range(count):
-                        # Get default name template for this appliance type
-                        default_names = DEFAULT_CHANNEL_NAMES.get(appliance_type, {})
-                        if len(default_names) == 1:
-                            # Single name type (e.g., switch, dimmer)
-                            channel_names[str(channel_idx)] = f"{default_names[1]} {i+1}"
-                        else:
-                            # Multi-name type (e.g., rgbw has 4 names)
-                            name_key = (i % len(default_names)) + 1
-                            channel_names[str(channel_idx)] = default_names.get(name_key, f"Channel {channel_idx}")
-                        channel_idx += 1
-                _LOGGER.info(f"Generated {len(channel_names)} default channel names from appliance counts")
-            
+            # Query channel names and states from device BEFORE saving
+            initial_states = ChannelStates()
             if channels > 1:  # Only for multi-channel devices
-                try:
-                    _LOGGER.info(f"Querying channel names for {subnet}.{device_id}...")
-                    queried_names = await self._query_channel_names(subnet, device_id, channels)
-                    _LOGGER.info(f"Received {len(queried_names)} channel names: {list(queried_names.keys())}")
-                    # Override defaults with queried names if available
-                    channel_names.update(queried_names)
-                except Exception as e:
-                    _LOGGER.error(f"Failed to query channel names: {e}", exc_info=True)
-                    # Continue with default channel names
+                async def on_phase(phase, result):
+                    _LOGGER.info(f"Received {phase} for {len(result)} channels")
+                    await emit({'phase': phase, 'count': len(result), 'channels': channels})
                 
-                # Query initial states for all channels
-                try:
-                    _LOGGER.info(f"Querying initial states for {subnet}.{device_id}...")
-                    initial_states = await self._query_initial_states(subnet, device_id, channels)
-                    _LOGGER.info(f"Received states for {len(initial_states)} channels")
-                except Exception as e:
-                    _LOGGER.error(f"Failed to query initial states: {e}", exc_info=True)
-                    # Continue without initial states
+                started = time.monotonic()
+                queried_names, initial_states = await self._query_device_details(
+                    subnet, device_id, channels, device_type, refresh_names, on_phase)
+                # Override defaults with queried names if available
+                channel_names.update(queried_names)
+                _LOGGER.info(f"Names + states for {subnet}.{device_id} in {time.monotonic() - started:.1f}s")
             else:
                 _LOGGER.warning(f"⚠️ Channels = {channels}, skipping queries (expected > 1)")
                 _LOGGER.debug(f"Single channel device, skipping queries")
             
             unique_id = f"tis_{subnet}_{device_id}"
+            device_info = self._build_device_record(subnet, device_id, model_name, channels, device_name,
+                                                    device_type, channel_names, initial_states, appliance_counts)
             
-            # Detect entity type from device_type_code (not model name!)
-            from const import get_appliance_type
-            entity_type = get_appliance_type(device_type) if device_type else self._detect_entity_type(model_name)
-            
-            device_type_hex = f"0x{device_type:04X}" if device_type else "None"
-            _LOGGER.info(f"Detected entity type: {entity_type} for device {device_type_hex} ({model_name})")
-            
-            device_info = {
-                'subnet': subnet,
-                'device_id': device_id,
-                'model_name': model_name,
-                'channels': channels,
-                'name': device_name or f"{model_name} ({subnet}.{device_id})",
-                'channel_names': channel_names,  # Add channel names to JSON
-                'initial_states': initial_states,  # Add initial states
-                'entity_type': entity_type,  # NEW: Entity type for HA
-                'appliance_counts': appliance_counts  # NEW: Detailed appliance breakdown
-            }
-            
-            # Save to /config/tis_devices.json (TIS integration reads from here)
-            devices_file = '/config/tis_devices.json'
-            devices = {}
-            try:
-                with open(devices_file, 'r') as f:
-                    devices = json.load(f)
-            except FileNotFoundError:
-                _LOGGER.info("Creating new tis_devices.json file")
-            except Exception as e:
-                _LOGGER.warning(f"Could not read existing devices: {e}")
-            
-            devices[unique_id] = device_info
-            
-            with open(devices_file, 'w') as f:
-                json.dump(devices, f, indent=2)
-            
+            await self._save_device_records({unique_id: device_info})
             _LOGGER.info(f"Device saved to JSON: {unique_id} - {device_name}")
+            await emit({'phase': 'saved', 'unique_id': unique_id})
             
             # Try to reload TIS integration automatically
             reload_success = await self._reload_tis_integration()
             
             if reload_success:
-                return web.json_response({
+                return await finish({
                     'success': True,
                     'message': f'✅ Cihaz eklendi: {device_name}\n\n🔄 TIS entegrasyonu otomatik olarak yenilendi!\nSensörler şimdi kullanıma hazır.'
                 })
             else:
-                return web.json_response({
+                return await finish({
                     'success': True,
                     'message': f'✅ Cihaz eklendi: {device_name}\n\n⚠️ Sensörleri görmek için TIS entegrasyonunu manuel yenileyin:\nSettings → Integrations → TIS → ⋮ → Reload'
                 })
                 
         except Exception as e:
             _LOGGER.error(f"Add device error: {e}", exc_info=True)
-            return web.json_response({'success': False, 'message': f'❌ Hata: {str(e)}'}, status=500)
-    
+            return await finish({'success': False, 'message': f'❌ Hata: {str(e)}'}, status=500)
+
+    async def handle_add_devices(self, request):
+        """Bulk add: query devices in parallel, write the JSON once and reload once.
+        
+        Body: {"devices": [{"subnet", "device_id", "model_name", "channels", "device_name", "device_type"}, ...]}
+        With ?stream=1 one NDJSON line is written per finished device, then 'saved' and 'done'.
+        """
+        stream = None
+        if request.query.get('stream') in ('1', 'true'):
+            stream = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache'})
+            await stream.prepare(request)
+        
+        async def emit(event: dict):
+            if stream is not None:
+                await stream.write((json.dumps(event) + '\n').encode())
+        
+        async def finish(result: dict, status: int = 200):
+            if stream is None:
+                return web.json_response(result, status=status)
+            await emit(dict(result, phase='done'))
+            await stream.write_eof()
+            return stream
+        
+        try:
+            data = await request.json()
+            requested = data.get('devices')
+            if not isinstance(requested, list) or not requested:
+                return await finish({'success': False, 'message': 'Eksik parametreler'}, status=400)
+            
+            total = len(requested)
+            _LOGGER.info(f"📥 Bulk add request: {total} devices")
+            started = time.monotonic()
+            records = {}
+            results = []
+            errors = []
+            
+            async def add_one(index: int, item: dict):
+                # Hatalı bir cihaz sadece kendi satırında hata verir, toplu ekleme devam eder
+                try:
+                    await add_device(item)
+                except Exception as e:
+                    _LOGGER.warning(f"Bulk add: device #{index} skipped: {e}")
+                    message = f"missing {e.args[0]}" if isinstance(e, KeyError) else str(e) or type(e).__name__
+                    error = {'index': index, 'error': message}
+                    if isinstance(item, dict) and 'subnet' in item and 'device_id' in item:
+                        error['unique_id'] = f"tis_{item['subnet']}_{item['device_id']}"
+                    errors.append(error)
+                    await emit(dict(error, phase='device', done=len(results) + len(errors), total=total))
+            
+            async def add_device(item: dict):
+                subnet = int(item['subnet'])
+                device_id = int(item['device_id'])
+                model_name = item['model_name']
+                if not model_name:
+                    raise ValueError('model_name missing')
+                channels = int(item.get('channels', 1))
+                device_type = _parse_device_type(item.get('device_type'))
+                unique_id = f"tis_{subnet}_{device_id}"
+                
+                appliance_counts, channel_names = self._default_channel_names(model_name)
+                initial_states = ChannelStates()
+                if channels > 1:
+                    queried_names, initial_states = await self._query_device_details(
+                        subnet, device_id, channels, device_type, bool(item.get('refresh_names')))
+                    channel_names.update(queried_names)
+                
+                records[unique_id] = self._build_device_record(
+                    subnet, device_id, model_name, channels, item.get('device_name'),
+                    device_type, channel_names, initial_states, appliance_counts)
+                result = {
+                    'unique_id': unique_id,
+                    'names': len(channel_names),
+                    'states': len(initial_states),
+                }
+                results.append(result)
+                await emit(dict(result, phase='device', done=len(results) + len(errors), total=total))
+            
+            # Cihazlar paralel sorgulanır; eşzamanlılık query_semaphore ile sınırlı
+            await asyncio.gather(*(add_one(index, item) for index, item in enumerate(requested)))
+            
+            if not records:
+                return await finish({'success': False, 'message': '❌ Hiçbir cihaz eklenemedi',
+                                     'errors': errors}, status=400)
+            
+            await self._save_device_records(records)
+            _LOGGER.info(f"Bulk add saved {len(records)} devices in {time.monotonic() - started:.1f}s")
+            await emit({'phase': 'saved', 'count': len(records)})
+            
+            # Try to reload TIS integration automatically (once for the whole batch)
+            reload_success = await self._reload_tis_integration()
+            
+            message = f'✅ {len(records)} cihaz eklendi'
+            if errors:
+                message += f'\n⚠️ {len(errors)} cihaz eklenemedi'
+            if reload_success:
+                message += '\n\n🔄 TIS entegrasyonu otomatik olarak yenilendi!'
+            else:
+                message += '\n\n⚠️ Sensörleri görmek için TIS entegrasyonunu manuel yenileyin:\nSettings → Integrations → TIS → ⋮ → Reload'
+            return await finish({
+                'success': True,
+                'message': message,
+                'devices': results,
+                'errors': errors,
+                'elapsed': round(time.monotonic() - started, 1),
+            })
+                
+        except Exception as e:
+            _LOGGER.error(f"Bulk add error: {e}", exc_info=True)
+            return await finish({'success': False, 'message': f'❌ Hata: {str(e)}'}, status=500)
+
+    async def handle_channel_names(self, request):
+        """Channel names of a device (cache first, ?refresh=1 queries the device)."""
+        try:
+            subnet = int(request.query['subnet'])
+            device_id = int(request.query['device_id'])
+            channels = int(request.query.get('channels', 24))
+            device_type = request.query.get('device_type')
+            device_type = int(device_type, 0) if device_type else None
+        except (KeyError, ValueError):
+            return web.json_response({'success': False, 'message': 'Eksik parametreler'}, status=400)
+        
+        refresh = request.query.get('refresh') in ('1', 'true')
+        cached = None if refresh else self.channel_name_cache.get(subnet, device_id, device_type, channels)
+        names = cached if cached is not None else await self._query_channel_names(
+            subnet, device_id, channels, device_type, refresh=True)
+        entry = self.channel_name_cache.entry(subnet, device_id, device_type) or {}
+        return web.json_response({
+            'success': True,
+            'channel_names': names,
+            'cached': cached is not None,
+            'last_verified': entry.get('last_verified'),
+        })
+
+    async def handle_channel_names_refresh(self, request):
+        """Re-query channel names from the device and update the cache."""
+        try:
+            data = await request.json()
+            subnet = int(data['subnet'])
+            device_id = int(data['device_id'])
+            channels = int(data.get('channels', 24))
+            device_type = _parse_device_type(data.get('device_type'))
+        except (KeyError, TypeError, ValueError):
+            return web.json_response({'success': False, 'message': 'Eksik parametreler'}, status=400)
+        
+        # Eski adlar sorgu sonucu ne olursa olsun bir daha sunulmaz
+        invalidated = self.channel_name_cache.invalidate(subnet, device_id, device_type)
+        names = await self._query_channel_names(subnet, device_id, channels, device_type, refresh=True)
+        if invalidated and not names:
+            await self.channel_name_cache.save_async(self.io)
+        entry = self.channel_name_cache.entry(subnet, device_id, device_type) or {}
+        return web.json_response({
+            'success': True,
+            'channel_names': names,
+            'last_verified': entry.get('last_verified'),
+        })
+
     async def handle_remove_device(self, request):
         """Handle remove device from Home Assistant request."""
         try:
@@ -1579,22 +2230,12 @@ class TISWebUI:
             unique_id = f"tis_{subnet}_{device_id}"
             
             # Remove from /config/tis_devices.json
-            devices_file = '/config/tis_devices.json'
-            devices = {}
-            try:
-                with open(devices_file, 'r') as f:
-                    devices = json.load(f)
-            except FileNotFoundError:
-                return web.json_response({'success': False, 'message': 'Cihaz dosyası bulunamadı'}, status=404)
-            
-            if unique_id not in devices:
+            removed = await self.io.run(self.device_store.remove, unique_id)
+            if removed is None:
                 return web.json_response({'success': False, 'message': 'Cihaz bulunamadı'}, status=404)
+            self.added_ids = self.added_ids - {unique_id}
             
-            device_name = devices[unique_id].get('name', f'{subnet}.{device_id}')
-            del devices[unique_id]
-            
-            with open(devices_file, 'w') as f:
-                json.dump(devices, f, indent=2)
+            device_name = removed.get('name', f'{subnet}.{device_id}')
             
             _LOGGER.info(f"Device removed from JSON: {unique_id} - {device_name}")
             
@@ -1619,14 +2260,7 @@ class TISWebUI:
     async def handle_fix_entity_types(self, request):
         """Fix entity_type for all devices by re-detecting from model names."""
         try:
-            devices_file = '/config/tis_devices.json'
-            
-            # Load devices
-            try:
-                with open(devices_file, 'r') as f:
-                    devices = json.load(f)
-            except FileNotFoundError:
-                return web.json_response({'success': False, 'message': 'Cihaz dosyası bulunamadı'}, status=404)
+            devices = await self.io.run(self.device_store.all)
             
             if not devices:
                 return web.json_response({'success': False, 'message': 'Kayıtlı cihaz yok'}, status=404)
@@ -1634,6 +2268,7 @@ class TISWebUI:
             # Re-detect entity types
             fixed_devices = []
             unchanged_devices = []
+            changes = {}
             
             for device_id, device_data in devices.items():
                 model_name = device_data.get('model_name', '')
@@ -1643,16 +2278,15 @@ class TISWebUI:
                 new_entity_type = self._detect_entity_type(model_name)
                 
                 if old_entity_type != new_entity_type:
-                    device_data['entity_type'] = new_entity_type
+                    changes[device_id] = {'entity_type': new_entity_type}
                     device_name = device_data.get('name', device_id)
                     fixed_devices.append(f"{device_name}: {old_entity_type} → {new_entity_type}")
                     _LOGGER.info(f"Fixed {device_id} ({model_name}): {old_entity_type} → {new_entity_type}")
                 else:
                     unchanged_devices.append(device_data.get('name', device_id))
             
-            # Save updated devices
-            with open(devices_file, 'w') as f:
-                json.dump(devices, f, indent=2, ensure_ascii=False)
+            # Save updated devices (only changed records, one write)
+            await self.io.run(self.device_store.update_many, changes)
             
             # Build response message
             if fixed_devices:
@@ -1750,8 +2384,15 @@ class TISWebUI:
             _LOGGER.error(f"Error reloading TIS integration: {e}", exc_info=True)
             return False
     
-    async def _query_channel_names(self, subnet: int, device_id: int, channels: int) -> dict:
-        """Query channel names from device via UDP with retry logic."""
+    async def _query_channel_names(self, subnet: int, device_id: int, channels: int,
+                                   device_type: int = None, refresh: bool = False) -> dict:
+        """Channel names from the cache, or queried from the device via UDP when stale."""
+        if not refresh:
+            cached = self.channel_name_cache.get(subnet, device_id, device_type, channels)
+            if cached is not None:
+                _LOGGER.info(f"📦 Channel names for {subnet}.{device_id} from cache ({len(cached)} names)")
+                return cached
+        
         try:
             from discovery import query_all_channel_names
             
@@ -1770,6 +2411,9 @@ class TISWebUI:
             
             # Convert integer keys to strings for JSON compatibility
             result = {str(k): v for k, v in channel_names.items()}
+            if result:
+                self.channel_name_cache.put(subnet, device_id, device_type, result, channels)
+                await self.channel_name_cache.save_async(self.io)
             
             return result
             
@@ -1777,7 +2421,7 @@ class TISWebUI:
             _LOGGER.error(f"❌ Failed to query channel names: {e}", exc_info=True)
             return {}
     
-    async def _query_initial_states(self, subnet: int, device_id: int, channels: int) -> dict:
+    async def _query_initial_states(self, subnet: int, device_id: int, channels: int) -> ChannelStates:
         """Query initial channel states from device."""
         try:
             from discovery import query_device_initial_states
@@ -1794,27 +2438,20 @@ class TISWebUI:
             )
             
             _LOGGER.info(f"✅ States query complete: {len(states)}/{channels} channels")
-            
-            # Convert to JSON-serializable format
-            result = {}
-            for ch, state in states.items():
-                result[str(ch)] = {
-                    'is_on': state['is_on'],
-                    'brightness': state['brightness'],
-                    'raw_value': state['raw_value']
-                }
-            
-            return result
+            return states
             
         except Exception as e:
             _LOGGER.error(f"❌ Failed to query initial states: {e}", exc_info=True)
-            return {}
+            return ChannelStates()
 
 
 async def main():
     """Main function."""
     parser = argparse.ArgumentParser(description='TIS Web UI Server')
     parser.add_argument('--log-level', default='info', choices=['debug', 'info', 'warning', 'error'], help='Log level')
+    parser.add_argument('--interface', default='', help='Network interface or IPv4 address for the SMARTCLOUD header (multi-homed hosts)')
+    parser.add_argument('--passive-discovery', action='store_true', help='Build the device inventory from bus traffic only (no broadcasts)')
+    parser.add_argument('--device-backend', default='json', choices=DEVICE_BACKENDS, help='Device registry storage (sqlite keeps tis_devices.json as an export)')
     args = parser.parse_args()
     
     # Set log level from argument
@@ -1827,10 +2464,15 @@ async def main():
     logging.getLogger().setLevel(log_level_map[args.log_level])
     _LOGGER.setLevel(log_level_map[args.log_level])
     _LOGGER.info(f"Log level set to: {args.log_level.upper()}")
-    _LOGGER.info("TIS Addon - Uses TIS integration API for device discovery")
+    _LOGGER.info("TIS Addon - Device discovery on the shared TIS bus")
+    
+    if args.interface:
+        set_local_interface(args.interface)
+        _LOGGER.info(f"SMARTCLOUD interface: {args.interface} ({get_local_ip()})")
 
     # Gateway and port not needed - using integration API
-    web_ui = TISWebUI(gateway_ip='0.0.0.0', udp_port=6000)
+    web_ui = TISWebUI(gateway_ip='0.0.0.0', udp_port=6000, passive_discovery=args.passive_discovery,
+                      device_backend=args.device_backend)
     await web_ui.start()
     
     # Keep running